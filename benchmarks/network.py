@@ -0,0 +1,173 @@
+"""Generates a synthetic Austrian rail network and imports it into the configured database.
+
+Stations are spread over the nine states, railways are chains of contiguous sections with one gauge, some railways
+have free sections continuing their end (for section assignment), further sections belong to no railway and warnings
+are attached to random sections. The same arguments always give the same network.
+
+    SIS_DATABASE_URI=sqlite:////tmp/network.db python -m benchmarks.network --stations 20000
+    python -m benchmarks.network --stations 20000 --files /tmp/network   (import files for flask import-data)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+# (towns, share of the stations) per state
+STATES = {
+    "Wien": (["Wien", "Floridsdorf", "Favoriten", "Liesing", "Simmering", "Donaustadt", "Meidling"], 0.20),
+    "Niederösterreich": (["St. Pölten", "Wiener Neustadt", "Amstetten", "Krems", "Baden", "Mödling", "Tulln", "Melk",
+                          "Gänserndorf", "Hollabrunn"], 0.19),
+    "Oberösterreich": (["Linz", "Wels", "Steyr", "Attnang-Puchheim", "Braunau", "Gmunden", "Vöcklabruck", "Enns"],
+                       0.17),
+    "Steiermark": (["Graz", "Leoben", "Bruck an der Mur", "Kapfenberg", "Mürzzuschlag", "Knittelfeld", "Liezen"], 0.14),
+    "Tirol": (["Innsbruck", "Kufstein", "Wörgl", "Landeck", "Schwaz", "Lienz", "Jenbach"], 0.08),
+    "Kärnten": (["Klagenfurt", "Villach", "Spittal", "Wolfsberg", "St. Veit", "Feldkirchen"], 0.06),
+    "Salzburg": (["Salzburg", "Hallein", "Bischofshofen", "Zell am See", "Saalfelden", "Schwarzach"], 0.06),
+    "Vorarlberg": (["Bregenz", "Feldkirch", "Dornbirn", "Bludenz", "Hohenems"], 0.05),
+    "Burgenland": (["Eisenstadt", "Neusiedl am See", "Mattersburg", "Oberwart", "Parndorf"], 0.05),
+}
+SUFFIXES = ["Hbf", "Nord", "Süd", "Ost", "West", "Stadt", "Bahnhof", "Haltestelle", "Markt", "Dorf"]
+SPEEDS = {1435: [80, 100, 120, 140, 160, 200, 230], 1000: [40, 50, 60, 80]}
+NARROW_GAUGE_SHARE = 0.1
+WARNING_TITLES = ["Bauarbeiten", "Weichenstörung", "Signalstörung", "Unwetter", "Oberleitungsschaden", "Murenabgang",
+                  "Schienenersatzverkehr", "Langsamfahrstelle"]
+
+
+class Network:
+    """The generated rows, in the format of the importer (railway_system/importer.py)."""
+
+    def __init__(self):
+        self.stations = []  # {"name", "state"}
+        self.sections = []  # {"start", "end", "length", "user_fee", "max_speed", "gauge"}
+        self.railways = []  # {"name", "stations"}
+        self.warnings = []  # {"title", "description", "sections"}
+
+    def sources(self):
+        # [(kind, filename, [(line, row)])] for import_network
+        return [
+            (kind, f"generated-{kind}", list(enumerate(getattr(self, kind), start=1)))
+            for kind in ("stations", "sections", "railways", "warnings")
+        ]
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for kind in ("stations", "sections", "railways", "warnings"):
+            with open(os.path.join(directory, f"{kind}.jsonl"), "w", encoding="utf-8") as stream:
+                for row in getattr(self, kind):
+                    stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def generate(stations=2000, railways=None, warnings=None, seed=1):
+    """Network with about `stations` stations, railways and warnings default to one per 20 stations."""
+    railways = stations // 20 if railways is None else railways
+    warnings = stations // 20 if warnings is None else warnings
+    rng = random.Random(seed)
+    network = Network()
+
+    # stations, "<town> <suffix>" numbered once a state runs out of names
+    by_state = {}
+    for state, (towns, share) in STATES.items():
+        names = by_state[state] = []
+        for i in range(max(2, round(stations * share))):
+            town, suffix = towns[i % len(towns)], SUFFIXES[i // len(towns) % len(SUFFIXES)]
+            round_ = i // (len(towns) * len(SUFFIXES))
+            names.append(f"{town} {suffix}" + (f" {round_ + 1}" if round_ else ""))
+        network.stations.extend({"name": name, "state": state} for name in names)
+    all_names = [station["name"] for station in network.stations]
+    states, weights = list(STATES), [share for _, share in STATES.values()]
+
+    pairs = set()
+
+    def section(start, end, gauge):
+        pairs.add((start, end))
+        length = round(rng.uniform(0.5, 30), 2)
+        network.sections.append({
+            "start": start, "end": end, "length": length, "user_fee": round(length * rng.uniform(1.5, 4), 2),
+            "max_speed": rng.choice(SPEEDS[gauge]), "gauge": gauge,
+        })
+
+    def next_station(current, names):
+        # mostly within the state, sometimes across the border; never a section twice
+        for _ in range(20):
+            candidate = rng.choice(names if rng.random() < 0.8 else all_names)
+            if candidate != current and (current, candidate) not in pairs:
+                return candidate
+        return None
+
+    # railways: contiguous chains of one gauge, half of them with free sections continuing their end
+    for number in range(1, railways + 1):
+        names = by_state[rng.choices(states, weights)[0]]
+        gauge = 1000 if rng.random() < NARROW_GAUGE_SHARE else 1435
+        path = [rng.choice(names)]
+        for _ in range(rng.randint(2, 15)):
+            station = next_station(path[-1], names)
+            if station is None or station in path:
+                break
+            section(path[-1], station, gauge)
+            path.append(station)
+        if len(path) < 2:
+            continue
+        network.railways.append({"name": f"Strecke {number}", "stations": path})
+        end = path[-1]
+        for _ in range(rng.randint(0, 3) if rng.random() < 0.5 else 0):
+            station = next_station(end, names)
+            if station is None:
+                break
+            section(end, station, gauge)
+            end = station
+
+    # sections of no railway
+    for _ in range(stations // 2):
+        start = rng.choice(all_names)
+        end = next_station(start, all_names)
+        if end is not None:
+            section(start, end, 1000 if rng.random() < NARROW_GAUGE_SHARE else 1435)
+
+    # warnings on 1-4 random sections
+    for number in range(1, warnings + 1):
+        affected = rng.sample(network.sections, min(len(network.sections), rng.randint(1, 4)))
+        title = rng.choice(WARNING_TITLES)
+        network.warnings.append({
+            "title": f"{title} {number}"[:30],
+            "description": f"{title} zwischen {affected[0]['start']} und {affected[0]['end']}",
+            "sections": [[s["start"], s["end"]] for s in affected],
+        })
+    return network
+
+
+def build(network):
+    """Imports network into the configured (empty or new) database, returns the ImportResult."""
+    from railway_system.importer import import_network
+    from railway_system.snapshot import create_schema
+
+    create_schema()
+    return import_network(network.sources())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--railways", type=int)
+    parser.add_argument("--warnings", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--files", metavar="DIRECTORY", help="write import files instead of importing")
+    args = parser.parse_args()
+
+    network = generate(args.stations, args.railways, args.warnings, args.seed)
+    if args.files:
+        network.write(args.files)
+        print(f"{len(network.stations)} stations, {len(network.sections)} sections, {len(network.railways)} railways, "
+              f"{len(network.warnings)} warnings written to {args.files}")
+        return 0
+
+    from railway_system import app
+
+    with app.app_context():
+        result = build(network)
+    print(result)
+    return 0 if result.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""Checks the number of SQL statements of every route on a small and a large generated network.
+
+Runs tests/test_query_budget.py, which does the checking, with the given network sizes and prints its table: a route
+fails if it executes more statements on the large network than on the small one (e.g. a lazy load per row in a
+template), more than the budget declared with @query_budget(n) next to its view function, or if its write does not
+go through.
+
+    python -m benchmarks.query_budget
+    python -m benchmarks.query_budget --sizes 5000 20000 --verbose
+"""
+import argparse
+import os
+import sys
+
+import pytest
+
+TEST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "test_query_budget.py")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs=2, default=(2000, 10000), metavar=("SMALL", "LARGE"),
+                        help="stations of the two networks, both big enough to fill every page")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="also list the routes within their budget")
+    args = parser.parse_args()
+
+    os.environ["SIS_QUERY_BUDGET_SIZES"] = " ".join(map(str, args.sizes))
+    os.environ["SIS_QUERY_BUDGET_SEED"] = str(args.seed)
+    os.environ["SIS_QUERY_BUDGET_VERBOSE"] = "1" if args.verbose else ""
+    # -s: the table is printed, not captured
+    return pytest.main([TEST, "-q", "-s", "-p", "no:cacheprovider"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
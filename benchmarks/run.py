@@ -0,0 +1,237 @@
+"""Runs the timed scenarios against a freshly generated network and writes the results as JSON.
+
+Every /get-... endpoint, the HTML list and detail pages, section assignment and deletion are requested `--repeat`
+times through the test client; the caches are off unless --cache is given, so every request does the full work.
+
+    python -m benchmarks.run --stations 20000 --repeat 10 --output before.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SLOWER = 1.2  # --compare marks scenarios whose median grew by more than this factor
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _reads(ids):
+    # (name, url) of the scenarios that do not change data
+    return [
+        ("api stations", "/get-stations"),
+        ("api stations all", "/get-stations?all=1"),
+        ("api station", f"/get-station/{ids['station']}"),
+        ("api railways", "/get-railways"),
+        ("api railways all", "/get-railways?all=1"),
+        ("api railway", f"/get-railway/{ids['railway']}"),
+        ("api sections", "/get-sections"),
+        ("api sections all", "/get-sections?all=1"),
+        ("api section", f"/get-section/{ids['section']}"),
+        ("api warnings", "/get-warnings"),
+        ("api warnings all", "/get-warnings?all=1"),
+        ("api warning", f"/get-warning/{ids['warning']}"),
+        ("page railways", "/railways"),
+        ("page railways with warnings", "/railways?warning=yes&sort=-total_length"),
+        ("page stations", "/stations"),
+        ("page stations last", "/stations?page=1000000"),
+        ("page sections", "/sections"),
+        ("page sections filtered", "/sections?gauge=1435&min_speed=120&assigned=no"),
+        ("page warnings", "/warnings"),
+        ("page railway", f"/railway/{ids['railway']}"),
+        ("page station", f"/station/{ids['station']}"),
+        ("page section assignment", f"/section-assignment/{ids['railway']}"),
+        ("page remove assignment", f"/remove-assignment/{ids['railway']}"),
+    ]
+
+
+def _writes(db, repeat):
+    """(name, [(url, form data)]) of the scenarios that change data, one target per run."""
+    from railway_system.models import Railway, Section
+
+    free = Section.__table__.alias()
+    assignments = db.session.query(Railway.id, free.c.id).join(
+        free, (free.c.starts_at == Railway.end_station_id) & (free.c.gauge == Railway.gauge)
+        & free.c.railway_id.is_(None)
+    ).order_by(Railway.id).all()
+    assign, seen = [], set()
+    for railway_id, section_id in assignments:
+        if railway_id not in seen and len(assign) < repeat:
+            seen.add(railway_id)
+            assign.append((f"/section-assignment/{railway_id}", {"sections": section_id}))
+
+    removals = []
+    for railway in Railway.query.filter(Railway.section_count > 1, Railway.id.notin_(seen)) \
+            .order_by(Railway.id).limit(repeat):
+        removals.append((f"/remove-assignment/{railway.id}", {"sections": railway.get_end_section().id}))
+
+    deletions = [
+        (f"/section/{section_id}/delete", {})
+        for section_id, in db.session.query(Section.id).filter(Section.railway_id.is_(None))
+        .order_by(Section.id.desc()).limit(repeat)
+    ]
+    db.session.remove()
+    return [("assign section", assign), ("remove assignment", removals), ("delete section", deletions)]
+
+
+def _summary(timings, statuses, size):
+    return {
+        "runs": len(timings),
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "statuses": sorted(set(statuses)),
+        "bytes": size,
+    }
+
+
+def run(args):
+    if args.database:
+        path = os.path.abspath(args.database)
+        if os.path.exists(path):
+            print(f"{path} already exists, the network is built in a new database", file=sys.stderr)
+            return 1
+    else:
+        directory = tempfile.mkdtemp(prefix="sis-benchmark-")
+        path = os.path.join(directory, "network.db")
+    os.environ["SIS_DATABASE_URI"] = f"sqlite:///{path}"
+    os.environ["SIS_SHARED_CACHE_PATH"] = ""
+
+    from railway_system import app, db, bcrypt
+    from railway_system.cache import fragments, responses
+    from railway_system.models import Station, Railway, Section, Warning, User
+    from . import network
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    if not args.cache:
+        fragments.max_entries = responses.max_entries = 0
+
+    with app.app_context():
+        start = time.perf_counter()
+        generated = network.generate(args.stations, seed=args.seed)
+        result = network.build(generated)
+        if not result.ok:
+            print(result, file=sys.stderr)
+            return 1
+        build_seconds = time.perf_counter() - start
+        user = User(username="benchmark", password=bcrypt.generate_password_hash("benchmark").decode("utf-8"),
+                    is_admin=True)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        counts = {model.__tablename__: model.query.count() for model in (Station, Section, Railway, Warning)}
+        # a railway from the middle with sections, the first section and warning with links
+        ids = {
+            "railway": db.session.query(Railway.id).filter(Railway.section_count > 0)
+            .order_by(Railway.id).offset(counts["railway"] // 2).limit(1).scalar(),
+            "station": counts["station"] // 2,
+            "section": db.session.query(Section.id).filter(Section.railway_id.isnot(None)).limit(1).scalar(),
+            "warning": db.session.query(Warning.id).limit(1).scalar(),
+        }
+        writes = _writes(db, args.repeat)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+
+    scenarios = {}
+    print(f"{'scenario':<32}{'median':>10}{'min':>10}{'bytes':>12}")
+    for name, url in _reads(ids):
+        client.get(url)  # warm up
+        timings, statuses, size = [], [], 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            size = len(response.data)
+            timings.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+        scenarios[name] = _summary(timings, statuses, size)
+    for name, targets in writes:
+        timings, statuses, size = [], [], 0
+        for url, data in targets:
+            start = time.perf_counter()
+            response = client.post(url, data=data)
+            timings.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+            size = len(response.data)
+        if timings:
+            scenarios[name] = _summary(timings, statuses, size)
+    for name, summary in scenarios.items():
+        print(f"{name:<32}{summary['median'] * 1000:>8.1f}ms{summary['min'] * 1000:>8.1f}ms{summary['bytes']:>12}"
+              + ("" if set(summary["statuses"]) <= {200, 302} else f"  status {summary['statuses']}"))
+
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "stations": args.stations,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "cache": args.cache,
+        },
+        "network": counts,
+        "build_seconds": build_seconds,
+        "scenarios": scenarios,
+    }
+    output = args.output or f"benchmark-{results['meta']['commit'] or 'unknown'}-{args.stations}.json"
+    with open(output, "w", encoding="utf-8") as stream:
+        json.dump(results, stream, indent=2, ensure_ascii=False)
+    print(f"results written to {output}")
+    return 0
+
+
+def compare(before_path, after_path):
+    with open(before_path, encoding="utf-8") as stream:
+        before = json.load(stream)
+    with open(after_path, encoding="utf-8") as stream:
+        after = json.load(stream)
+    if before["meta"]["stations"] != after["meta"]["stations"] or before["meta"]["seed"] != after["meta"]["seed"]:
+        print("warning: the results were measured on different networks", file=sys.stderr)
+    print(f"{'scenario':<32}{before['meta']['commit'] or 'before':>10}{after['meta']['commit'] or 'after':>10}"
+          f"{'ratio':>8}")
+    slower = 0
+    for name, summary in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            print(f"{name:<32}{'-':>10}{summary['median'] * 1000:>8.1f}ms")
+            continue
+        ratio = summary["median"] / old["median"]
+        slower += ratio > SLOWER
+        print(f"{name:<32}{old['median'] * 1000:>8.1f}ms{summary['median'] * 1000:>8.1f}ms{ratio:>7.2f}x"
+              + ("  slower" if ratio > SLOWER else ""))
+    return 1 if slower else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache", action="store_true", help="keep the fragment and API caches on")
+    parser.add_argument("--database", help="new database file to build the network in (default: a temporary file)")
+    parser.add_argument("--output", help="JSON file for the results (default: benchmark-<commit>-<stations>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
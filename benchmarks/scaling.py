@@ -0,0 +1,150 @@
+"""Times the section assignment page and the section <-> warning joins on generated networks of growing size.
+
+With the indexes of the candidate lookup and the link table the latency of these requests depends on the rows they
+show, not on the size of the network. Every network is built and measured in a process of its own (the app binds its
+database on import), the caches are off. Fails if a scenario gets more than --growth times slower from the smallest to
+the largest network.
+
+    python -m benchmarks.scaling
+    python -m benchmarks.scaling --sizes 2000 20000 80000 --repeat 50 --plans
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+GROWTH = 2.0
+
+
+def _ids(db):
+    from railway_system.models import Railway, Section, SectionWarning
+
+    free = Section.__table__.alias()
+    # a railway whose end has free candidates, the section and warning with the most links
+    railway = db.session.query(Railway.id).join(
+        free, (free.c.starts_at == Railway.end_station_id) & (free.c.gauge == Railway.gauge)
+        & free.c.railway_id.is_(None)
+    ).order_by(Railway.id).limit(1).scalar()
+    section = db.session.query(SectionWarning.section_id).group_by(SectionWarning.section_id) \
+        .order_by(db.func.count().desc(), SectionWarning.section_id).limit(1).scalar()
+    warning = db.session.query(SectionWarning.warning_id).group_by(SectionWarning.warning_id) \
+        .order_by(db.func.count().desc(), SectionWarning.warning_id).limit(1).scalar()
+    return railway, section, warning
+
+
+def _scenarios(railway, section, warning):
+    return [
+        ("page section assignment", f"/section-assignment/{railway}"),
+        ("page warning", f"/warning/{warning}"),
+        ("page section", f"/section/{section}"),
+        ("api warning", f"/get-warning/{warning}"),
+        ("api section", f"/get-section/{section}"),
+    ]
+
+
+# statements whose plan --plans prints: the candidate lookup and both directions of the link table
+PLANS = [
+    ("candidates", "SELECT id FROM section WHERE railway_id IS NULL AND starts_at = ? AND gauge = ?", (1, 1435)),
+    ("free sections", "SELECT id, starts_at, ends_at, gauge FROM section WHERE railway_id IS NULL", ()),
+    ("warnings of a section", "SELECT warning.id FROM warning, section_warning "
+                              "WHERE ? = section_warning.section_id AND warning.id = section_warning.warning_id", (1,)),
+    ("sections of a warning", "SELECT section.id FROM section, section_warning "
+                              "WHERE ? = section_warning.warning_id AND section.id = section_warning.section_id", (1,)),
+]
+
+
+def measure(stations, seed, repeat):
+    """{"sections": n, "scenarios": {name: median seconds}, "plans": {name: [plan lines]}} of a new network."""
+    directory = tempfile.mkdtemp(prefix="sis-scaling-")
+    os.environ["SIS_DATABASE_URI"] = f"sqlite:///{os.path.join(directory, 'network.db')}"
+    os.environ["SIS_SHARED_CACHE_PATH"] = ""
+
+    from railway_system import app, db, bcrypt
+    from railway_system.cache import fragments, responses
+    from railway_system.models import Section, User
+    from . import network
+
+    fragments.max_entries = responses.max_entries = 0
+    with app.app_context():
+        result = network.build(network.generate(stations, seed=seed))
+        if not result.ok:
+            raise SystemExit(str(result))
+        user = User(username="scaling", password=bcrypt.generate_password_hash("x").decode("utf-8"), is_admin=True)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        sections = Section.query.count()
+        scenarios = _scenarios(*_ids(db))
+        connection = db.session.connection()
+        plans = {
+            name: [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            for name, statement, parameters in PLANS
+        }
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    medians = {}
+    for name, url in scenarios:
+        client.get(url)  # warm up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise SystemExit(f"{url}: status {response.status_code}")
+        medians[name] = statistics.median(timings)
+    return {"sections": sections, "scenarios": medians, "plans": plans}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=(2000, 10000, 40000), metavar="STATIONS")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--growth", type=float, default=GROWTH, help="allowed slowdown from the smallest network")
+    parser.add_argument("--plans", action="store_true", help="print the query plans on the largest network")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # views that print must not end up in the results
+        with contextlib.redirect_stdout(sys.stderr):
+            results = measure(args.measure, args.seed, args.repeat)
+        json.dump(results, sys.stdout)
+        return 0
+
+    runs = [
+        json.loads(subprocess.run(
+            [sys.executable, "-m", "benchmarks.scaling", "--measure", str(size), "--seed", str(args.seed),
+             "--repeat", str(args.repeat)],
+            capture_output=True, text=True, check=True,
+        ).stdout)
+        for size in args.sizes
+    ]
+    print(f"{'scenario':<26}" + "".join(f"{run['sections']:>10}" for run in runs) + f"{'growth':>9}")
+    failures = 0
+    for name in runs[0]["scenarios"]:
+        medians = [run["scenarios"][name] for run in runs]
+        growth = medians[-1] / medians[0]
+        failures += growth > args.growth
+        print(f"{name:<26}" + "".join(f"{median * 1000:>8.2f}ms" for median in medians) + f"{growth:>8.2f}x"
+              + ("  slower" if growth > args.growth else ""))
+    print(f"(columns: sections in the network, median of {args.repeat} requests)")
+    if args.plans:
+        for name, plan in runs[-1]["plans"].items():
+            print(f"\n{name}:")
+            for line in plan:
+                print(f"    {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
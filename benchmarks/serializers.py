@@ -0,0 +1,52 @@
+"""Compares marshmallow and the fast row serializer on the hot API endpoints.
+
+Runs against the configured database, point it at a large one with SIS_DATABASE_URI, e.g.
+
+    SIS_DATABASE_URI=sqlite:////tmp/network.db python -m benchmarks.serializers --repeat 5
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from railway_system import app
+
+ENDPOINTS = (
+    "/get-railways?all=1",
+    "/get-sections?all=1",
+    "/get-railways?limit=100",
+    "/get-sections?limit=100",
+)
+
+
+def measure(client, url, repeat):
+    timings = []
+    body = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = client.get(url).data
+        timings.append(time.perf_counter() - start)
+    return body, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    identical = True
+    print(f"{'endpoint':<28}{'bytes':>10}{'marshmallow':>14}{'fast':>10}{'speedup':>10}")
+    for url in ENDPOINTS:
+        separator = "&" if "?" in url else "?"
+        slow_body, slow = measure(client, f"{url}{separator}serializer=marshmallow", args.repeat)
+        fast_body, fast = measure(client, f"{url}{separator}serializer=fast", args.repeat)
+        same = slow_body == fast_body
+        identical = identical and same
+        print(f"{url:<28}{len(slow_body):>10}{slow * 1000:>12.1f}ms{fast * 1000:>8.1f}ms{slow / fast:>9.1f}x"
+              + ("" if same else "  OUTPUT DIFFERS"))
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""railway summary columns
+
+Revision ID: 1f2f624fb845
+Revises: 219b044aff58
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f2f624fb845'
+down_revision = '219b044aff58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the batch rebuild drops the railway table, which is still referenced by section.railway_id
+    op.execute("PRAGMA foreign_keys=OFF")
+    with op.batch_alter_table('railway', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start_station_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('end_station_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('gauge', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('section_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('total_length', sa.Numeric(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('total_user_fee', sa.Numeric(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('warning_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_foreign_key('fk_railway_start_station_id', 'station', ['start_station_id'], ['id'])
+        batch_op.create_foreign_key('fk_railway_end_station_id', 'station', ['end_station_id'], ['id'])
+    op.execute("PRAGMA foreign_keys=ON")
+
+    # fill in the summary of existing railways, sections are chained in insertion order
+    op.execute("""
+        UPDATE railway SET
+            start_station_id = (SELECT starts_at FROM section WHERE railway_id = railway.id ORDER BY id LIMIT 1),
+            end_station_id = (SELECT ends_at FROM section WHERE railway_id = railway.id ORDER BY id DESC LIMIT 1),
+            gauge = (SELECT gauge FROM section WHERE railway_id = railway.id ORDER BY id LIMIT 1),
+            section_count = (SELECT count(*) FROM section WHERE railway_id = railway.id),
+            total_length = (SELECT coalesce(sum(length), 0) FROM section WHERE railway_id = railway.id),
+            total_user_fee = (SELECT coalesce(sum(user_fee), 0) FROM section WHERE railway_id = railway.id),
+            warning_count = (SELECT count(*) FROM section_warning
+                             JOIN section ON section.id = section_warning.section_id
+                             WHERE section.railway_id = railway.id)
+    """)
+
+
+def downgrade():
+    op.execute("PRAGMA foreign_keys=OFF")
+    with op.batch_alter_table('railway', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_railway_end_station_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_railway_start_station_id', type_='foreignkey')
+        batch_op.drop_column('warning_count')
+        batch_op.drop_column('total_user_fee')
+        batch_op.drop_column('total_length')
+        batch_op.drop_column('section_count')
+        batch_op.drop_column('gauge')
+        batch_op.drop_column('end_station_id')
+        batch_op.drop_column('start_station_id')
+    op.execute("PRAGMA foreign_keys=ON")
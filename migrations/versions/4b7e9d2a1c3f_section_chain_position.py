@@ -0,0 +1,51 @@
+"""position of sections in their railway and tail pointer
+
+Revision ID: 4b7e9d2a1c3f
+Revises: 8c1d2e4f6a7b
+Create Date: 2026-10-18 16:41:09.530127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e9d2a1c3f'
+down_revision = '8c1d2e4f6a7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('section', sa.Column('position', sa.Integer(), nullable=True))
+    # the batch rebuild drops the railway table, which is still referenced by section.railway_id
+    op.execute("PRAGMA foreign_keys=OFF")
+    with op.batch_alter_table('railway', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tail_section_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_railway_tail_section_id', 'section', ['tail_section_id'], ['id'],
+                                    deferrable=True, initially='DEFERRED')
+    op.execute("PRAGMA foreign_keys=ON")
+
+    # number the existing chains in insertion order, as they were shown so far
+    op.execute("""
+        UPDATE section SET position = (
+            SELECT count(*) FROM section AS previous
+            WHERE previous.railway_id = section.railway_id AND previous.id < section.id
+        ) WHERE railway_id IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE railway SET
+            tail_section_id = (SELECT id FROM section WHERE railway_id = railway.id ORDER BY position DESC LIMIT 1)
+    """)
+    op.create_index('uq_section_railway_id_position', 'section', ['railway_id', 'position'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_section_railway_id_position', table_name='section')
+    op.execute("PRAGMA foreign_keys=OFF")
+    with op.batch_alter_table('railway', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_railway_tail_section_id', type_='foreignkey')
+        batch_op.drop_column('tail_section_id')
+    with op.batch_alter_table('section', schema=None) as batch_op:
+        batch_op.drop_column('position')
+    op.execute("PRAGMA foreign_keys=ON")
@@ -0,0 +1,39 @@
+"""indexes of the assignment candidates and the section <-> warning joins
+
+Revision ID: 6e2f8a4b9d15
+Revises: 4b7e9d2a1c3f
+Create Date: 2026-10-18 18:02:37.114506
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2f8a4b9d15'
+down_revision = '4b7e9d2a1c3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # partial: only free sections are candidates
+    op.create_index('ix_section_free_starts_at_gauge', 'section', ['starts_at', 'gauge', 'ends_at'], unique=False,
+                    sqlite_where=sa.text('railway_id IS NULL'), postgresql_where=sa.text('railway_id IS NULL'))
+    # railway_id is the first column of uq_section_railway_id_position
+    op.drop_index('ix_section_railway_id', table_name='section')
+    op.create_index('ix_section_warning_section_id_warning_id', 'section_warning', ['section_id', 'warning_id'],
+                    unique=False)
+    op.create_index('ix_section_warning_warning_id_section_id', 'section_warning', ['warning_id', 'section_id'],
+                    unique=False)
+    op.drop_index('ix_section_warning_section_id', table_name='section_warning')
+    op.drop_index('ix_section_warning_warning_id', table_name='section_warning')
+
+
+def downgrade():
+    op.create_index('ix_section_warning_warning_id', 'section_warning', ['warning_id'], unique=False)
+    op.create_index('ix_section_warning_section_id', 'section_warning', ['section_id'], unique=False)
+    op.drop_index('ix_section_warning_warning_id_section_id', table_name='section_warning')
+    op.drop_index('ix_section_warning_section_id_warning_id', table_name='section_warning')
+    op.create_index('ix_section_railway_id', 'section', ['railway_id'], unique=False)
+    op.drop_index('ix_section_free_starts_at_gauge', table_name='section')
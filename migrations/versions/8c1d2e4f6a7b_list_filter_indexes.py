@@ -0,0 +1,34 @@
+"""indexes of the list filters
+
+Revision ID: 8c1d2e4f6a7b
+Revises: 1f2f624fb845
+Create Date: 2026-10-18 13:05:44.918263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d2e4f6a7b'
+down_revision = '1f2f624fb845'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_station_state'), 'station', ['state'], unique=False)
+    op.create_index(op.f('ix_section_gauge'), 'section', ['gauge'], unique=False)
+    op.create_index(op.f('ix_section_max_speed'), 'section', ['max_speed'], unique=False)
+    op.create_index(op.f('ix_section_railway_id'), 'section', ['railway_id'], unique=False)
+    op.create_index(op.f('ix_section_warning_section_id'), 'section_warning', ['section_id'], unique=False)
+    op.create_index(op.f('ix_section_warning_warning_id'), 'section_warning', ['warning_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_section_warning_warning_id'), table_name='section_warning')
+    op.drop_index(op.f('ix_section_warning_section_id'), table_name='section_warning')
+    op.drop_index(op.f('ix_section_railway_id'), table_name='section')
+    op.drop_index(op.f('ix_section_max_speed'), table_name='section')
+    op.drop_index(op.f('ix_section_gauge'), table_name='section')
+    op.drop_index(op.f('ix_station_state'), table_name='station')
@@ -1,18 +1,52 @@
+import os
+
 from flask import Flask
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy, event
 from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
 
+from .database import Database
+
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "3cd7d089a25376da2d10d0b88b429cd1"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///railway_system.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("SIS_DATABASE_URI", "sqlite:///railway_system.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JSON_SORT_KEYS"] = False
+app.config["API_PAGE_SIZE"] = 100  # default page size of the /get-{item}s endpoints
+app.config["API_MAX_PAGE_SIZE"] = 1000
+app.config["API_STREAM_BATCH_SIZE"] = 500  # rows fetched at once by ?stream=1
+app.config["LIST_PAGE_SIZE"] = 50  # rows per page of the HTML lists
+app.config["LIST_MAX_PAGE_SIZE"] = 500
+# rendered railway and station pages kept in memory (see cache.py)
+app.config["FRAGMENT_CACHE_SIZE"] = 2000
+app.config["FRAGMENT_CACHE_MAX_BYTES"] = 32 * 1024 * 1024
+# JSON responses of the /get-... endpoints kept in memory, API_CACHE_SIZE = 0 turns the cache off
+app.config["API_CACHE_SIZE"] = 5000
+app.config["API_CACHE_MAX_BYTES"] = 64 * 1024 * 1024
+app.config["API_CACHE_TTL"] = 300  # seconds, fallback for changes the change tracking cannot see
+# state shared by all worker processes (see sharedcache.py): None puts it next to a SQLite database, "" turns it off
+app.config["SHARED_CACHE_PATH"] = os.environ.get("SIS_SHARED_CACHE_PATH")
+app.config["SHARED_CACHE_SIZE"] = 5000  # API responses kept in the shared store, 0 turns that part off
+# endpoints serialized from plain SQL rows instead of marshmallow (see serializers.py)
+app.config["API_FAST_SERIALIZER"] = {"api_railways", "api_railway", "api_sections", "api_section"}
+# SQLite connection profile (see database.py): "wal" or "legacy", SQLITE_PRAGMAS overrides single pragmas
+app.config["SQLITE_PROFILE"] = os.environ.get("SIS_SQLITE_PROFILE", "wal")
+app.config["SQLITE_PRAGMAS"] = {}
+app.config["DATABASE_READ_POOL_SIZE"] = 8  # read-only connections, 0 reads through the writer
+app.config["DATABASE_WRITE_TIMEOUT"] = 30  # seconds a write waits for the writer connection
+# per endpoint request metrics under /metrics (see instrumentation.py), off unless SIS_METRICS=1
+app.config["METRICS_ENABLED"] = os.environ.get("SIS_METRICS") == "1"
+app.config["METRICS_BUCKETS"] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # latency, seconds
+# ?__profile=1 for admins (see instrumentation.py): number of functions in the cProfile report
+app.config["PROFILE_LIMIT"] = 40
+# SQL statements slower than this (seconds) are written to SLOW_QUERY_LOG, None turns the log off
+app.config["SLOW_QUERY_SECONDS"] = float(os.environ.get("SIS_SLOW_QUERY_SECONDS", 0.5)) or None
+app.config["SLOW_QUERY_LOG"] = os.environ.get("SIS_SLOW_QUERY_LOG", os.path.join(app.instance_path, "slow_queries.log"))
+# bound parameters in the slow query log (truncated), off: they can hold user names and password hashes
+app.config["SLOW_QUERY_LOG_PARAMETERS"] = os.environ.get("SIS_SLOW_QUERY_LOG_PARAMETERS") == "1"
 # "sqlite:1_railway_system/resources/railway_system.db"
-db = SQLAlchemy(app)
-event.listen(db.engine, 'connect', lambda c, _: c.execute('pragma foreign_keys=on'))
+db = Database(app)
 
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
@@ -26,6 +60,8 @@ ma = Marshmallow(app)
 from . import models
 
 # Flask Migrate
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(app.root_path), "migrations"))
 
 from . import routes
+from . import commands
+from . import instrumentation
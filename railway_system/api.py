@@ -0,0 +1,220 @@
+from functools import lru_cache
+
+from flask import request, jsonify, abort, json, stream_with_context
+from marshmallow import fields as ma_fields
+from sqlalchemy.orm import load_only, joinedload, selectinload
+
+from . import app
+
+
+# <---------------------------- sparse fieldsets ---------------------------->
+
+def _path_set(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return {path.strip() for path in value.split(",") if path.strip()}
+
+
+def _below(paths, name):
+    # "sections.start_station.name" -> "start_station.name" for name == "sections"
+    if paths is None:
+        return None
+    return {p.split(".", 1)[1] for p in paths if p.startswith(name + ".")}
+
+
+def field_plan(schema_cls, fields=None, expand=None):
+    """Which fields of schema_cls to emit as {name: None} for attributes and {name: sub plan} for nested schemas.
+
+    fields lists the wanted attributes (dotted paths reach into nested schemas, a nested name on its own means all
+    of its attributes), expand lists the nested relations to emit. None means no restriction. Unknown names -> 400.
+    """
+    declared = schema_cls.Meta.fields
+    nested = {name: f.nested for name, f in schema_cls._declared_fields.items() if isinstance(f, ma_fields.Nested)}
+    wanted = {p.split(".", 1)[0] for p in fields} if fields is not None else None
+    expanded = {p.split(".", 1)[0] for p in expand} if expand is not None else None
+    for name in (wanted or set()) | (expanded or set()):
+        if name not in declared or (expanded is not None and name in expanded and name not in nested):
+            abort(400)
+
+    plan = {}
+    for name in declared:
+        if name not in nested:
+            if wanted is None or name in wanted:
+                plan[name] = None
+        elif (wanted is not None and name in wanted) or (wanted is None and (expanded is None or name in expanded)):
+            plan[name] = field_plan(nested[name], _below(fields, name) or None, _below(expand, name))
+    return plan
+
+
+def _only(plan):
+    paths = []
+    for name, sub in plan.items():
+        if sub is None:
+            paths.append(name)
+        else:
+            paths.extend(f"{name}.{path}" for path in _only(sub))
+    return paths
+
+
+@lru_cache(maxsize=256)
+def _schema(schema_cls, only, many):
+    return schema_cls(only=only, many=many)
+
+
+def loader_options(model, plan, path=None):
+    # load only the columns the plan emits, joined loads for single objects, SELECT ... IN for collections
+    columns = [getattr(model, name) for name, sub in plan.items() if sub is None and hasattr(model, name)]
+    options = [path.load_only(*columns) if path is not None else load_only(*columns)]
+    for name, sub in plan.items():
+        if sub is None:
+            continue
+        relationship = getattr(model, name)
+        if relationship.property.uselist:
+            child = path.selectinload(relationship) if path is not None else selectinload(relationship)
+        else:
+            child = path.joinedload(relationship) if path is not None else joinedload(relationship)
+        options.extend(loader_options(relationship.property.mapper.class_, sub, child))
+    return options
+
+
+def select_fields(model, schema, options=()):
+    """Query and schema for the request, honouring ?fields= and ?expand=.
+
+    Without both parameters the full schema and the default eager loading plan (options) are used.
+    """
+    fields, expand = _path_set("fields"), _path_set("expand")
+    if fields is None and expand is None:
+        return model.query.options(*options), schema
+    plan = field_plan(type(schema), fields, expand)
+    return model.query.options(*loader_options(model, plan)), _schema(type(schema), tuple(_only(plan)), schema.many)
+
+
+@lru_cache(maxsize=None)
+def _relationships(model):
+    return model.__table__.name, tuple((name, rel.mapper.class_) for name, rel in model.__mapper__.relationships.items())
+
+
+def payload_rows(model, data, rows=None):
+    """(table, id) of every object in a dumped payload of model, nested objects included.
+
+    Objects dumped without their id (?fields=) stand for (table, None), any row of the table.
+    """
+    rows = set() if rows is None else rows
+    if isinstance(data, dict) and "items" in data and "next_cursor" in data:
+        data = data["items"]
+    table, relationships = _relationships(model)
+    for item in data if isinstance(data, list) else [data]:
+        if not isinstance(item, dict):
+            continue
+        rows.add((table, item.get("id")))
+        for name, child in relationships:
+            value = item.get(name)
+            if value:
+                payload_rows(child, value, rows)
+    return rows
+
+
+# <---------------------------- pagination ---------------------------->
+
+def _int_arg(name):
+    # type=int would silently fall back to the default, a broken cursor would then start over at the first page
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+
+def page_args():
+    limit = _int_arg("limit")
+    if limit is None:
+        limit = app.config["API_PAGE_SIZE"]
+    if limit < 1:
+        abort(400)
+    return min(limit, app.config["API_MAX_PAGE_SIZE"]), _int_arg("after")
+
+
+def keyset_page(query, model):
+    """One page of query ordered by id, driven by ?limit= and ?after=<last id of the previous page>.
+
+    Returns the rows and the cursor of the next page (None on the last page). Seeking past the cursor uses the
+    primary key index, so every page costs the same no matter how deep into the table it is.
+    """
+    limit, after = page_args()
+    query = query.order_by(model.id)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.limit(limit + 1).all()  # one extra row tells whether there is a next page
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def dump_collection(query, model, schema, fast=None):
+    if wants_stream():
+        return stream_collection(query, model, schema)
+    if fast is not None and use_fast_serializer():
+        return fast_collection(fast)
+    # full dumps of a table are opt-in with ?all=1 and keep the plain list format
+    if request.args.get("all", 0, type=int) == 1:
+        return jsonify(schema.dump(query.order_by(model.id).all()))
+    items, next_cursor = keyset_page(query, model)
+    return jsonify(items=schema.dump(items), next_cursor=next_cursor)
+
+
+# <---------------------------- streaming ---------------------------->
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_stream():
+    if request.args.get("stream", 0, type=int) == 1:
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def stream_collection(query, model, schema):
+    """Whole table as newline delimited JSON, one object per line.
+
+    Rows are fetched in batches of API_STREAM_BATCH_SIZE (eager loads run once per batch) and every object is
+    written out as soon as it is serialized, so memory use does not depend on the size of the table.
+    """
+    query = query.order_by(model.id).yield_per(app.config["API_STREAM_BATCH_SIZE"])
+
+    def generate():
+        for obj in query:
+            yield json.dumps(schema.dump(obj, many=False), separators=(",", ":")) + "\n"
+
+    return app.response_class(stream_with_context(generate()), mimetype=NDJSON)
+
+
+# <---------------------------- fast serializer ---------------------------->
+
+def use_fast_serializer():
+    # ?serializer=fast|marshmallow overrides the API_FAST_SERIALIZER setting of the endpoint
+    if "fields" in request.args or "expand" in request.args:
+        return False
+    choice = request.args.get("serializer")
+    if choice is not None:
+        return choice == "fast"
+    return request.endpoint in app.config["API_FAST_SERIALIZER"]
+
+
+def fast_collection(fast):
+    if request.args.get("all", 0, type=int) == 1:
+        return jsonify(fast())
+    limit, after = page_args()
+    items = fast(after=after, limit=limit + 1)
+    if len(items) > limit:
+        return jsonify(items=items[:limit], next_cursor=items[limit - 1]["id"])
+    return jsonify(items=items, next_cursor=None)
+
+
+def dump_item(query, id, schema, fast=None):
+    if fast is not None and use_fast_serializer():
+        items = fast(ids=[id])
+        return jsonify(items[0] if items else {})
+    return jsonify(schema.dump(query.get(id)))
@@ -0,0 +1,186 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+
+from . import app
+from .api import payload_rows, wants_stream
+from .versioning import data_version
+
+log = logging.getLogger(__name__)
+
+
+class DependencyCache:
+    """LRU cache with precise invalidation.
+
+    Every entry names the rows it was built from as (table, id), (table, None) for "any row of table". A commit that
+    changes one of them (see versioning.py) drops the entry, a change of a whole table drops every entry depending on
+    that table. Entries are only stored if no commit happened while they were built, so an entry never outlives the
+    data it shows. ttl (seconds) additionally limits the age of an entry, for changes the change tracking cannot see.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, rows, expires)
+        self.by_row = {}  # (table, id) -> keys
+        self.by_table = {}  # table -> keys with any row of table
+        self.whole_table = {}  # table -> keys with (table, None)
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.invalidations = self.expired = 0
+        self.lock = threading.Lock()
+        data_version.subscribe(self.invalidate)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[3] is not None and entry[3] < time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size, rows, version):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if data_version.version != version:
+                return
+            self._remove(key)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self.entries[key] = (value, size, rows, expires)
+            self.size += size
+            for row in rows:
+                for index, index_key in (self._index_of(row), (self.by_table, row[0])):
+                    index.setdefault(index_key, set()).add(key)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _index_of(self, row):
+        return (self.by_row, row) if row[1] is not None else (self.whole_table, row[0])
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.size -= entry[1]
+        for row in entry[2]:
+            for index, index_key in (self._index_of(row), (self.by_table, row[0])):
+                keys = index.get(index_key)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[index_key]
+        return True
+
+    def invalidate(self, rows):
+        with self.lock:
+            for table, row_id in rows:
+                keys = set(self.whole_table.get(table, ()))
+                keys |= self.by_table.get(table, set()) if row_id is None else self.by_row.get((table, row_id), set())
+                for key in keys:
+                    self.invalidations += self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "expired": self.expired,
+            }
+
+
+fragments = DependencyCache(app.config["FRAGMENT_CACHE_SIZE"], app.config["FRAGMENT_CACHE_MAX_BYTES"])
+responses = DependencyCache(app.config["API_CACHE_SIZE"], app.config["API_CACHE_MAX_BYTES"],
+                            app.config["API_CACHE_TTL"])
+
+
+def cached_fragment(key, render):
+    """The cached value of key, render() -> (value, size, rows) on a miss."""
+    value = fragments.get(key)
+    if value is None:
+        version = data_version.version
+        value, size, rows = render()
+        fragments.set(key, value, size, rows, version)
+    return value
+
+
+def _json_response(body, state):
+    response = app.response_class(body, mimetype="application/json")
+    response.headers["X-Cache"] = state
+    return response
+
+
+def cached_response(model):
+    """Caches the JSON responses of an API view per id and query string.
+
+    The entry depends on every row the payload contains (nested objects included) and, for lists, on the whole
+    table of model, so that new and deleted rows show up. Streamed responses are not cached. Responses are kept in
+    this process and, if there is one, in the store shared by all workers.
+    """
+    table = model.__table__.name
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if responses.max_entries <= 0 or wants_stream():
+                return f(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+            body = responses.get(key)
+            if body is not None:
+                return _json_response(body, "HIT")
+
+            version = data_version.version
+            shared = data_version.shared
+            shared_key = json.dumps(key)
+            if shared is not None:
+                try:
+                    cached = shared.get(shared_key)
+                except sqlite3.Error as e:
+                    log.warning("shared cache not readable: %s", e)
+                    cached = None
+                if cached is not None:
+                    body, rows = cached
+                    responses.set(key, body, len(body), rows, version)
+                    return _json_response(body, "HIT-SHARED")
+
+            response = app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and response.is_json:
+                rows = payload_rows(model, response.get_json())
+                rows.add((table, kwargs["id"]) if "id" in kwargs else (table, None))
+                body = response.get_data()
+                responses.set(key, body, len(body), rows, version)
+                if shared is not None:
+                    try:
+                        shared.set(shared_key, body, rows, version, responses.ttl)
+                    except sqlite3.Error as e:
+                        log.warning("shared cache not writable: %s", e)
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,112 @@
+from collections import deque
+
+from sqlalchemy.orm import selectinload
+
+from . import db
+from .models import Section
+
+# Assigning a whole chain of sections to the end of a railway at once: the sections are either given in order or
+# found as the shortest path of free sections with one gauge between two stations. All checks run over the chain in
+# one pass before anything is changed, the caller commits the whole chain in one transaction.
+
+CHUNK_SIZE = 500  # ids per IN (...)
+
+
+class ChainError(Exception):
+    """The chain cannot be assigned, the message is shown to the user."""
+
+
+def load_sections(section_ids):
+    """Sections of section_ids in that order, with their warnings (append_section counts them)."""
+    found = {}
+    for i in range(0, len(section_ids), CHUNK_SIZE):
+        chunk = section_ids[i:i + CHUNK_SIZE]
+        found.update((s.id, s) for s in Section.query.options(selectinload(Section.warnings))
+                     .filter(Section.id.in_(chunk)).populate_existing())
+    missing = [section_id for section_id in section_ids if section_id not in found]
+    if missing:
+        raise ChainError(f"Abschnitt {missing[0]} existiert nicht")
+    return [found[section_id] for section_id in section_ids]
+
+
+def check_chain(railway, sections):
+    """Raises ChainError unless sections continue the end of railway, each other and keep its gauge."""
+    if not sections:
+        raise ChainError("keine Abschnitte angegeben")
+    end, gauge = railway.end_station_id, railway.gauge
+    if gauge is None:
+        gauge = sections[0].gauge
+    seen = set()
+    for number, section in enumerate(sections, start=1):
+        label = f"Abschnitt {section.id} (Nr. {number})"
+        if section.id in seen:
+            raise ChainError(f"{label} kommt mehrfach vor")
+        seen.add(section.id)
+        if section.railway_id is not None:
+            raise ChainError(f"{label} gehört bereits zu einer Strecke")
+        if end is not None and section.starts_at != end:
+            raise ChainError(f"{label} schließt nicht an den vorherigen Abschnitt an")
+        if section.gauge != gauge:
+            raise ChainError(f"{label} hat eine andere Spurweite ({section.gauge} mm statt {gauge} mm)")
+        end = section.ends_at
+
+
+def free_path(source, target, gauge=None):
+    """Ids of the fewest free sections leading from station source to station target, all with one gauge.
+
+    gauge=None allows any gauge for the first section, the following ones keep it. Breadth-first search over the
+    free sections, loaded with one SELECT.
+    """
+    query = db.session.query(Section.id, Section.starts_at, Section.ends_at, Section.gauge) \
+        .filter(Section.railway_id.is_(None))
+    if gauge is not None:
+        query = query.filter(Section.gauge == gauge)
+    leaving = {}
+    for section_id, starts_at, ends_at, section_gauge in query:
+        leaving.setdefault(starts_at, []).append((section_id, ends_at, section_gauge))
+
+    # nodes are (station, gauge of the chain so far)
+    start = (source, gauge)
+    via = {start: None}  # node -> (previous node, section id)
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        station, chain_gauge = node
+        if station == target and node != start:
+            path = []
+            while via[node] is not None:
+                node, section_id = via[node]
+                path.append(section_id)
+            return path[::-1]
+        for section_id, ends_at, section_gauge in leaving.get(station, ()):
+            if chain_gauge is not None and section_gauge != chain_gauge:
+                continue
+            successor = (ends_at, section_gauge)
+            if successor not in via:
+                via[successor] = (node, section_id)
+                queue.append(successor)
+    return None
+
+
+def assign_chain(railway, section_ids=None, source=None, target=None):
+    """Appends the chain to railway and returns its sections, raises ChainError before changing anything.
+
+    Either section_ids in order, or target (and source if the railway has no sections yet) to take the shortest
+    path of free sections. Call database.begin_write() first so that the checked state cannot change until the
+    commit.
+    """
+    if section_ids is None:
+        if railway.end_station_id is not None:
+            if source is not None and source != railway.end_station_id:
+                raise ChainError("die Kette muss am Ende der Strecke beginnen")
+            source = railway.end_station_id
+        if source is None or target is None:
+            raise ChainError("Start- und Zielbahnhof angeben")
+        section_ids = free_path(source, target, railway.gauge)
+        if section_ids is None:
+            raise ChainError("keine durchgehende Kette freier Abschnitte mit gleicher Spurweite gefunden")
+    sections = load_sections(section_ids)
+    check_chain(railway, sections)
+    for section in sections:
+        railway.append_section(section)
+    return sections
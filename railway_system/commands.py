@@ -0,0 +1,57 @@
+import click
+
+from . import app
+from .importer import KINDS, kind_of, read_rows, import_network
+from .snapshot import SnapshotError, export_snapshot, restore_snapshot
+
+
+@app.cli.command("import-data")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--kind", type=click.Choice(KINDS), help="Art der Daten, falls nicht am Dateinamen erkennbar.")
+def import_data(files, kind):
+    """Importiert Bahnhöfe, Abschnitte, Strecken und Warnungen aus CSV- oder JSONL-Dateien.
+
+    Die Art der Daten wird am Dateinamen erkannt (stations.csv, sections.jsonl, railways.csv, warnings.jsonl).
+    """
+    handles = []
+    sources = []
+    try:
+        for path in files:
+            file_kind = kind or kind_of(path)
+            if file_kind is None:
+                raise click.UsageError(f"Art der Daten in {path} unbekannt, bitte --kind angeben.")
+            handle = open(path, encoding="utf-8-sig", newline="")
+            handles.append(handle)
+            sources.append((file_kind, path, read_rows(handle, path)))
+        result = import_network(sources)
+    finally:
+        for handle in handles:
+            handle.close()
+    if not result.ok:
+        click.echo(str(result), err=True)
+        raise click.ClickException(f"{len(result.errors)} Fehler, es wurde nichts importiert.")
+    click.echo(f"Importiert: {result}")
+
+
+@app.cli.group()
+def snapshot():
+    """Export und Wiederherstellung des gesamten Streckennetzes."""
+
+
+@snapshot.command("export")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+def snapshot_export(path):
+    """Schreibt alle Bahnhöfe, Abschnitte, Strecken und Warnungen in eine Snapshot-Datei (.jsonl.gz)."""
+    counts = export_snapshot(path)
+    click.echo("Exportiert: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+
+@snapshot.command("restore")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def snapshot_restore(path):
+    """Lädt eine Snapshot-Datei in eine leere Datenbank."""
+    try:
+        counts = restore_snapshot(path)
+    except SnapshotError as e:
+        raise click.ClickException(str(e))
+    click.echo("Wiederhergestellt: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
@@ -0,0 +1,144 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine import URL
+from sqlalchemy.pool import QueuePool
+
+# Connection profile of a file based SQLite database:
+#
+#   writer   the engine of Flask-SQLAlchemy (db.engine), a pool of exactly one connection. Every write of every thread
+#            goes through it, one transaction after the other, a second writer waits for the connection instead of
+#            failing with "database is locked".
+#   readers  a pool of read-only connections (db.read_engine). With WAL they read the last committed state while the
+#            writer writes, so reads neither block nor are blocked.
+#
+# A session reads through the readers until it writes (flush or INSERT/UPDATE/DELETE statement), from then on until
+# the end of its transaction everything goes through the writer, so it sees its own changes. A write that depends on
+# what it read first (e.g. appending to the end of a chain) calls begin_write() before reading.
+
+PROFILES = {
+    # defaults for a web server with concurrent readers and writers
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # KiB
+        "busy_timeout": 5000,  # ms
+        "foreign_keys": "ON",
+    },
+    # SQLite defaults, e.g. for databases on network file systems where WAL does not work
+    "legacy": {
+        "foreign_keys": "ON",
+    },
+}
+
+# pragmas a read-only connection must not set
+WRITE_PRAGMAS = ("journal_mode",)
+
+
+def _set_pragmas(pragmas):
+    def on_connect(connection, _):
+        for name, value in pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+
+    return on_connect
+
+
+def _is_file(sa_url):
+    return sa_url.drivername.startswith("sqlite") and sa_url.database not in (None, "", ":memory:")
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        read_engine = self.db.read_engine
+        if read_engine is None or self._flushing or self.info.get("writes"):
+            return super().get_bind(mapper, clause)
+        return read_engine
+
+
+class Database(SQLAlchemy):
+    """SQLAlchemy with the connection profile above for file based SQLite databases.
+
+    SQLITE_PROFILE names one of PROFILES, SQLITE_PRAGMAS overrides single pragmas of it. DATABASE_READ_POOL_SIZE
+    read-only connections are kept (0 reads through the writer), DATABASE_WRITE_TIMEOUT is the time in seconds a
+    write waits for the writer.
+    """
+
+    read_engine = None
+
+    def create_scoped_session(self, options=None):
+        session = super().create_scoped_session(options)
+        _track_writes(session)
+        return session
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def pragmas(self, app):
+        pragmas = dict(PROFILES[app.config["SQLITE_PROFILE"]])
+        pragmas.update(app.config["SQLITE_PRAGMAS"])
+        return pragmas
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        if _is_file(sa_url):
+            options.update(poolclass=QueuePool, pool_size=1, max_overflow=0,
+                           pool_timeout=app.config["DATABASE_WRITE_TIMEOUT"])
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if not sa_url.drivername.startswith("sqlite"):
+            return engine
+        app = self.get_app()
+        if not _is_file(sa_url):
+            event.listen(engine, "connect", _set_pragmas({"foreign_keys": "ON"}))
+            return engine
+
+        pragmas = self.pragmas(app)
+        event.listen(engine, "connect", _set_pragmas(pragmas))
+        # the writer creates the file and switches it to WAL before the first reader opens it
+        engine.connect().close()
+        size = app.config["DATABASE_READ_POOL_SIZE"]
+        if size > 0:
+            read_url = URL.create(sa_url.drivername, database=f"file:{sa_url.database}",
+                                  query={"mode": "ro", "uri": "true"})
+            self.read_engine = create_engine(read_url, poolclass=QueuePool, pool_size=size, max_overflow=size,
+                                             connect_args={"check_same_thread": False})
+            event.listen(self.read_engine, "connect", _set_pragmas(
+                {name: value for name, value in pragmas.items() if name not in WRITE_PRAGMAS}))
+        else:
+            self.read_engine = None
+        return engine
+
+
+def begin_write(session):
+    """Moves the transaction of session to the writer and takes the write lock of the database right away.
+
+    Everything read afterwards stays valid until the commit: other threads wait for the writer connection, other
+    processes for the SQLite lock (BEGIN IMMEDIATE). Objects loaded before the call have to be refreshed.
+    """
+    session.info["writes"] = True
+    connection = session.connection()
+    if connection.dialect.name == "sqlite" and not connection.connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _track_writes(session):
+    @event.listens_for(session, "before_flush")
+    def _note_flush(session, flush_context, instances):
+        session.info["writes"] = True
+
+    @event.listens_for(session, "do_orm_execute")
+    def _note_statement(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info["writes"] = True
+
+    @event.listens_for(session, "after_transaction_end")
+    def _end_writes(session, transaction):
+        if transaction.parent is None:
+            session.info.pop("writes", None)
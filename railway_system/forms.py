@@ -1,7 +1,9 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, DecimalField, IntegerField, RadioField, \
     SelectField, SelectMultipleField, TextAreaField
-from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, NoneOf, InputRequired
+from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, NoneOf, InputRequired, Optional, \
+    NumberRange
 from .models import User, Station, Section, Railway
 
 
@@ -70,6 +72,27 @@ class SectionAssignment2(FlaskForm):
     submit = SubmitField("Bestätigen")
 
 
+class ChainAssignmentForm(FlaskForm):
+    # either the ids of the sections in order or the stations the chain of free sections should lead to
+    section_ids = StringField("Abschnitte in Reihenfolge (IDs, z.B. 4, 7, 12)", validators=[Optional()])
+    starts_at = SelectField("Von Bahnhof (nur bei Strecken ohne Abschnitte)", coerce=int)
+    ends_at = SelectField("Bis Bahnhof", coerce=int)
+    submit = SubmitField("Kette zuordnen")
+
+    def validate_section_ids(self, field):
+        if not all(value.isdigit() for value in field.data.replace(",", " ").split()):
+            raise ValidationError("Nur Abschnitt-IDs getrennt durch Beistriche angeben.")
+
+    def section_id_list(self):
+        if not self.section_ids.data:
+            return None
+        return [int(value) for value in self.section_ids.data.replace(",", " ").split()]
+
+    def validate_ends_at(self, field):
+        if not self.section_ids.data and not field.data:
+            raise ValidationError("Abschnitte oder einen Bis-Bahnhof angeben.")
+
+
 class WarningForm(FlaskForm):
     sections = SelectMultipleField(
         "Betroffene Abschnitte (Mehrfachauswahl möglich)",
@@ -79,3 +102,52 @@ class WarningForm(FlaskForm):
     title = StringField("Titel", validators=[DataRequired(), Length(min=2, max=30)])
     description = TextAreaField("Beschreibung", validators=[DataRequired(), Length(min=2, max=255)])
     submit = SubmitField("Bestätigen")
+
+
+IMPORT_CHOICES = [("stations", "Bahnhöfe"),
+                  ("sections", "Abschnitte"),
+                  ("railways", "Strecken"),
+                  ("warnings", "Warnungen")]
+class ImportForm(FlaskForm):
+    kind = SelectField("Art der Daten", choices=IMPORT_CHOICES, validators=[DataRequired()])
+    file = FileField("Datei (CSV oder JSONL)", validators=[FileRequired(), FileAllowed(["csv", "jsonl", "ndjson"])])
+    submit = SubmitField("Importieren")
+
+
+# <---------------- filters of the list pages (GET parameters, no CSRF token) ---------------->
+
+YES_NO_CHOICES = [("", "Alle"), ("yes", "Ja"), ("no", "Nein")]
+class ListFilterForm(FlaskForm):
+    class Meta:
+        csrf = False
+
+    per_page = IntegerField("Pro Seite", validators=[Optional(), NumberRange(min=1)])
+
+
+class RailwayFilterForm(ListFilterForm):
+    warning = SelectField("Mit Warnung", choices=YES_NO_CHOICES, validators=[Optional()])
+    sort = SelectField("Sortierung", choices=[("id", "ID"), ("name", "Name"), ("-total_length", "Länge")],
+                       validators=[Optional()])
+
+
+class StationFilterForm(ListFilterForm):
+    state = SelectField("Bundesland", choices=[("", "Alle")] + STATE_CHOICES, validators=[Optional()])
+    sort = SelectField("Sortierung", choices=[("id", "ID"), ("name", "Name"), ("state", "Bundesland")],
+                       validators=[Optional()])
+
+
+class SectionFilterForm(ListFilterForm):
+    gauge = SelectField("Spurweite", choices=[("", "Alle")] + [(str(g), label) for g, label in GAUGE_CHOICES],
+                        validators=[Optional()])
+    min_speed = IntegerField("Geschwindigkeit ab", validators=[Optional(), NumberRange(min=0)])
+    max_speed = IntegerField("Geschwindigkeit bis", validators=[Optional(), NumberRange(min=0)])
+    assigned = SelectField("Einer Strecke zugeordnet", choices=YES_NO_CHOICES, validators=[Optional()])
+    warning = SelectField("Mit Warnung", choices=YES_NO_CHOICES, validators=[Optional()])
+    sort = SelectField("Sortierung", choices=[("id", "ID"), ("-max_speed", "Geschwindigkeit"),
+                                              ("-length", "Länge"), ("gauge", "Spurweite")],
+                       validators=[Optional()])
+
+
+class WarningFilterForm(ListFilterForm):
+    railway = SelectField("Betroffene Strecke", validators=[Optional()])  # choices set in the view
+    sort = SelectField("Sortierung", choices=[("id", "ID"), ("title", "Titel")], validators=[Optional()])
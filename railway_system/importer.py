@@ -0,0 +1,341 @@
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import func, select, update, bindparam, type_coerce, Float
+from sqlalchemy.dialects.sqlite import insert
+
+from . import db
+from .database import begin_write
+from .forms import STATE_CHOICES, GAUGE_CHOICES
+from .models import Station, Section, Railway, Warning, SectionWarning
+
+# Bulk import of stations, sections, railways and warnings from CSV or JSON lines files.
+#
+#   stations: name, state
+#   sections: start, end, length, user_fee, max_speed, gauge     (start/end are station names)
+#   railways: name, stations                                     (ordered station names, "A;B;C" in CSV)
+#   warnings: title, description, sections                       (start>end pairs, "A>B;B>C" in CSV)
+#
+# Everything is validated first and all errors are reported together. Only an error free import is written, in a
+# single transaction with executemany batches. Validation already holds the write lock (database.begin_write).
+
+KINDS = ("stations", "sections", "railways", "warnings")
+BATCH_SIZE = 5000
+
+STATES = {state for state, _ in STATE_CHOICES}
+GAUGES = {gauge for gauge, _ in GAUGE_CHOICES}
+
+
+class ImportResult:
+    def __init__(self):
+        self.errors = []  # (source, line, message)
+        self.counts = dict.fromkeys(KINDS, 0)
+
+    def error(self, source, line, message):
+        self.errors.append((source, line, message))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __str__(self):
+        if self.errors:
+            return "\n".join(f"{source}:{line}: {message}" for source, line, message in self.errors)
+        return ", ".join(f"{count} {kind}" for kind, count in self.counts.items())
+
+
+def kind_of(filename):
+    # "stations.csv", "sections-2022.jsonl", ... -> kind from the start of the file name
+    name = os.path.basename(filename).lower()
+    for kind in KINDS:
+        if name.startswith(kind):
+            return kind
+    return None
+
+
+def read_rows(stream, filename):
+    """(line number, dict) for every record of a .csv or .jsonl/.ndjson text stream."""
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {"__error__": f"kein gültiges JSON ({e})"}
+                if not isinstance(row, dict):
+                    row = {"__error__": "JSON-Objekt erwartet"}
+                yield number, row
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _list(value, separator=";"):
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in (value or "").split(separator) if item.strip()]
+
+
+def _pair(value):
+    if isinstance(value, list) and len(value) == 2:
+        return tuple(value)
+    parts = [part.strip() for part in str(value).split(">")]
+    return tuple(parts) if len(parts) == 2 else None
+
+
+def _number(row, key, kind):
+    # None for anything that is not a finite number, for kind=int also for numbers with a fractional part
+    try:
+        value = Decimal(str(row.get(key, "")).strip())
+    except InvalidOperation:
+        return None
+    if not value.is_finite() or kind is int and value != value.to_integral_value():
+        return None
+    return kind(value)
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _batches(rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        yield rows[i:i + BATCH_SIZE]
+
+
+def _execute(statement, rows):
+    for batch in _batches(rows):
+        db.session.execute(statement, batch)
+
+
+def _next_id(model):
+    return db.session.query(func.coalesce(func.max(model.id), 0)).scalar() + 1
+
+
+def import_network(sources):
+    """Imports sources = [(kind, filename, rows)] with rows as produced by read_rows."""
+    result = ImportResult()
+    records = {kind: [] for kind in KINDS}
+    for kind, filename, rows in sources:
+        for number, row in rows:
+            if "__error__" in row:
+                result.error(filename, number, row["__error__"])
+            else:
+                records[kind].append((filename, number, row))
+
+    # the files are read, from here on validation and writes run in one transaction with the write lock: the checks
+    # (sections free, names and ids unused) stay true until the commit, concurrent assignments and imports wait
+    session = db.session
+    begin_write(session)
+    station_ids = dict(session.query(Station.name, Station.id))
+
+    # <---------------- stations ---------------->
+    stations = {}
+    for filename, number, row in records["stations"]:
+        name, state = str(row.get("name") or "").strip(), str(row.get("state") or "").strip()
+        if not name:
+            result.error(filename, number, "Name fehlt")
+        elif state not in STATES:
+            result.error(filename, number, f"unbekanntes Bundesland '{state}'")
+        elif name in stations:
+            result.error(filename, number, f"Bahnhof '{name}' mehrfach angegeben")
+        else:
+            stations[name] = state
+    known_stations = set(station_ids) | set(stations)
+
+    # <---------------- sections ---------------->
+    # sections of a railway cannot be changed by the import, only given again with the same values
+    assigned_sections = {
+        (starts_at, ends_at): (length, user_fee, max_speed, gauge)
+        for starts_at, ends_at, length, user_fee, max_speed, gauge in session.execute(select(
+            Section.starts_at, Section.ends_at, type_coerce(Section.length, Float), type_coerce(Section.user_fee, Float),
+            Section.max_speed, Section.gauge
+        ).where(Section.railway_id.isnot(None)))
+    } if records["sections"] else {}
+    sections = {}
+    for filename, number, row in records["sections"]:
+        start, end = str(row.get("start") or "").strip(), str(row.get("end") or "").strip()
+        length, user_fee = _number(row, "length", Decimal), _number(row, "user_fee", Decimal)
+        max_speed, gauge = _number(row, "max_speed", int), _number(row, "gauge", int)
+        for station in (start, end):
+            if station not in known_stations:
+                result.error(filename, number, f"unbekannter Bahnhof '{station}'")
+        if start == end:
+            result.error(filename, number, "Start- und End-Bahnhof sind gleich")
+        if length is None or length <= 0 or user_fee is None or user_fee < 0:
+            result.error(filename, number, "ungültige Länge oder Nutzungsentgelt")
+        if max_speed is None or max_speed <= 0:
+            result.error(filename, number, "ungültige Maximalgeschwindigkeit")
+        if gauge not in GAUGES:
+            result.error(filename, number, f"ungültige Spurweite '{row.get('gauge')}'")
+        if (start, end) in sections:
+            result.error(filename, number, f"Abschnitt {start} - {end} mehrfach angegeben")
+        assigned = assigned_sections.get((station_ids.get(start), station_ids.get(end)))
+        if assigned is not None and assigned != (_float(length), _float(user_fee), max_speed, gauge):
+            result.error(filename, number, f"Abschnitt {start} - {end} gehört bereits zu einer Strecke und kann "
+                                           f"nicht geändert werden")
+        sections[(start, end)] = (length, user_fee, max_speed, gauge)
+
+    if not result.ok:
+        session.rollback()
+        return result
+
+    # stations and sections first, railways and warnings refer to them by station names
+    if stations:
+        statement = insert(Station.__table__)
+        statement = statement.on_conflict_do_update(index_elements=["name"], set_={"state": statement.excluded.state})
+        _execute(statement, [{"name": name, "state": state} for name, state in stations.items()])
+        station_ids = dict(session.query(Station.name, Station.id))
+    if sections:
+        # existing sections are updated as long as they do not belong to a railway yet (checked above, those are
+        # only given again unchanged)
+        statement = insert(Section.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=["starts_at", "ends_at"],
+            set_={column: statement.excluded[column] for column in ("length", "user_fee", "max_speed", "gauge")},
+            where=Section.__table__.c.railway_id.is_(None),
+        )
+        _execute(statement, [
+            {"starts_at": station_ids[start], "ends_at": station_ids[end], "length": float(length),
+             "user_fee": float(user_fee), "max_speed": max_speed, "gauge": gauge}
+            for (start, end), (length, user_fee, max_speed, gauge) in sections.items()
+        ])
+
+    section_by_stations = {
+        (starts_at, ends_at): (section_id, gauge, railway_id, length, user_fee)
+        for section_id, starts_at, ends_at, gauge, railway_id, length, user_fee in session.execute(select(
+            Section.id, Section.starts_at, Section.ends_at, Section.gauge, Section.railway_id, Section.length,
+            Section.user_fee
+        ))
+    }
+
+    def resolve(filename, number, start, end):
+        if start not in station_ids or end not in station_ids:
+            result.error(filename, number, f"unbekannter Bahnhof in {start} > {end}")
+            return None
+        section = section_by_stations.get((station_ids[start], station_ids[end]))
+        if section is None:
+            result.error(filename, number, f"kein Abschnitt {start} > {end}")
+        return section
+
+    # <---------------- railways: check every chain in one pass ---------------->
+    existing_railways = {name: (railway_id, count) for railway_id, name, count in
+                         session.query(Railway.id, Railway.name, Railway.section_count)}
+    railways = []
+    names = set()
+    used = set()
+    for filename, number, row in records["railways"]:
+        name = str(row.get("name") or "").strip()
+        path = _list(row.get("stations"))
+        if not name:
+            result.error(filename, number, "Name fehlt")
+            continue
+        if name in names:
+            result.error(filename, number, f"Strecke '{name}' mehrfach angegeben")
+            continue
+        names.add(name)
+        if name in existing_railways and existing_railways[name][1] > 0:
+            result.error(filename, number, f"Strecke '{name}' hat bereits Abschnitte")
+            continue
+        if len(path) == 1:
+            result.error(filename, number, "eine Strecke braucht mindestens zwei Bahnhöfe")
+            continue
+        chain = []
+        for start, end in zip(path, path[1:]):
+            section = resolve(filename, number, start, end)
+            if section is None:
+                continue
+            section_id, gauge, railway_id, _, _ = section
+            if railway_id is not None or section_id in used:
+                result.error(filename, number, f"Abschnitt {start} > {end} gehört bereits zu einer Strecke")
+            elif chain and gauge != chain[0][1]:
+                result.error(filename, number, f"Abschnitt {start} > {end} hat eine andere Spurweite")
+            used.add(section_id)
+            chain.append(section)
+        railways.append((name, path, chain))
+
+    # <---------------- warnings ---------------->
+    warnings = []
+    touched_railways = set()  # railways whose sections get new warnings
+    for filename, number, row in records["warnings"]:
+        title, description = str(row.get("title") or "").strip(), str(row.get("description") or "").strip()
+        if not 2 <= len(title) <= 30 or not 2 <= len(description) <= 255:
+            result.error(filename, number, "Titel (2-30 Zeichen) oder Beschreibung (2-255 Zeichen) ungültig")
+        affected = []
+        for value in _list(row.get("sections")):
+            pair = _pair(value)
+            if pair is None:
+                result.error(filename, number, f"ungültiger Abschnitt '{value}', erwartet Start>Ende")
+                continue
+            section = resolve(filename, number, *pair)
+            if section is not None:
+                affected.append(section[0])
+                if section[2] is not None:
+                    touched_railways.add(section[2])
+        if not affected:
+            result.error(filename, number, "keine betroffenen Abschnitte")
+        warnings.append((title, description, sorted(set(affected))))
+
+    if not result.ok:
+        session.rollback()
+        return result
+
+    if railways:
+        new_names = [name for name, _, _ in railways if name not in existing_railways]
+        next_id = _next_id(Railway)
+        _execute(Railway.__table__.insert(), [{"id": next_id + i, "name": name} for i, name in enumerate(new_names)])
+        railway_ids = dict(session.query(Railway.name, Railway.id).filter(Railway.name.in_([r[0] for r in railways])))
+        touched_railways.update(railway_ids.values())
+        assignments, summaries = [], []
+        for name, path, chain in railways:
+            railway_id = railway_ids[name]
+            assignments.extend({"section_id": section[0], "railway": railway_id, "position": position}
+                               for position, section in enumerate(chain))
+            summaries.append({
+                "railway": railway_id,
+                "start": station_ids[path[0]] if chain else None,
+                "end": station_ids[path[-1]] if chain else None,
+                "gauge": chain[0][1] if chain else None,
+                "count": len(chain),
+                "length": float(sum(section[3] for section in chain)),
+                "user_fee": float(sum(section[4] for section in chain)),
+                "tail": chain[-1][0] if chain else None,
+            })
+        section_table, railway_table = Section.__table__, Railway.__table__
+        _execute(update(section_table).where(section_table.c.id == bindparam("section_id"))
+                 .values(railway_id=bindparam("railway"), position=bindparam("position")), assignments)
+        _execute(update(railway_table).where(railway_table.c.id == bindparam("railway")).values(
+            start_station_id=bindparam("start"), end_station_id=bindparam("end"), gauge=bindparam("gauge"),
+            section_count=bindparam("count"), total_length=bindparam("length"),
+            total_user_fee=bindparam("user_fee"), tail_section_id=bindparam("tail"),
+        ), summaries)
+
+    if warnings:
+        next_id = _next_id(Warning)
+        _execute(Warning.__table__.insert(), [
+            {"id": next_id + i, "title": title, "description": description}
+            for i, (title, description, _) in enumerate(warnings)
+        ])
+        _execute(SectionWarning.__table__.insert(), [
+            {"section_id": section_id, "warning_id": next_id + i}
+            for i, (_, _, affected) in enumerate(warnings) for section_id in affected
+        ])
+
+    if touched_railways:
+        # warning counts of every railway that got sections or warnings, counted with one grouped join
+        counts = dict.fromkeys(touched_railways, 0)
+        counts.update(session.query(Section.railway_id, func.count(SectionWarning.id))
+                      .join(SectionWarning, SectionWarning.section_id == Section.id)
+                      .filter(Section.railway_id.isnot(None)).group_by(Section.railway_id))
+        railway_table = Railway.__table__
+        _execute(update(railway_table).where(railway_table.c.id == bindparam("railway"))
+                 .values(warning_count=bindparam("count")),
+                 [{"railway": railway_id, "count": counts[railway_id]} for railway_id in touched_railways])
+
+    session.commit()
+    result.counts = {"stations": len(stations), "sections": len(sections), "railways": len(railways),
+                     "warnings": len(warnings)}
+    return result
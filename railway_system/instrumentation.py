@@ -0,0 +1,301 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from logging.handlers import RotatingFileHandler
+
+from flask import g, has_request_context, request, jsonify, abort
+from flask_login import current_user
+from jinja2 import Template
+from sqlalchemy import event
+
+from . import app, db
+
+# Three kinds of instrumentation, all fed by the cursor execute events of the writer and reader engines.
+#
+# Per endpoint request metrics in the Prometheus text format under /metrics:
+#
+#   sis_request_duration_seconds        histogram of the request latency
+#   sis_request_sql_statements_total    SQL statements executed
+#   sis_request_sql_seconds_total       time spent in SQL statements
+#   sis_request_rows_loaded_total       ORM objects loaded
+#   sis_response_bytes_total            size of the response bodies (streamed responses are not counted)
+#   sis_template_render_seconds_total   time spent rendering templates
+#
+# Only active with METRICS_ENABLED, otherwise /metrics does not exist. The numbers are per process, with several
+# workers every scrape sees the worker that answers it.
+#
+# Profiler: an admin adds ?__profile=1 to any URL and gets, instead of the page, a JSON report of that request: the
+# cProfile breakdown, every SQL statement in order with its duration and EXPLAIN QUERY PLAN and the peak memory
+# allocated (tracemalloc). Only one request is profiled at a time.
+#
+# Slow query log: statements that take at least SLOW_QUERY_SECONDS are appended to SLOW_QUERY_LOG, without their bound
+# parameters unless SLOW_QUERY_LOG_PARAMETERS is set.
+
+LOGGED_PARAMETER_LENGTH = 40  # characters per parameter value in the slow query log
+
+COUNTERS = (
+    ("sql_statements", "sis_request_sql_statements_total", "SQL statements executed"),
+    ("sql_seconds", "sis_request_sql_seconds_total", "Time spent in SQL statements"),
+    ("rows", "sis_request_rows_loaded_total", "ORM objects loaded"),
+    ("bytes", "sis_response_bytes_total", "Bytes of the response bodies"),
+    ("render_seconds", "sis_template_render_seconds_total", "Time spent rendering templates"),
+)
+
+
+class RequestMetrics:
+    """Counters of the current request, kept in g."""
+
+    __slots__ = ("start", "sql_statements", "sql_seconds", "rows", "bytes", "render_seconds")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = self.rows = self.bytes = 0
+        self.sql_seconds = self.render_seconds = 0.0
+
+
+class Registry:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.histograms = {}  # endpoint -> [count per bucket..., sum, count]
+        self.counters = {}  # endpoint -> {name: value}
+
+    def observe(self, endpoint, duration, metrics):
+        with self.lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                histogram = self.histograms[endpoint] = [0] * len(self.buckets) + [0.0, 0]
+                self.counters[endpoint] = dict.fromkeys((name for name, _, _ in COUNTERS), 0)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            counters = self.counters[endpoint]
+            for name in counters:
+                counters[name] += getattr(metrics, name)
+
+    def render(self):
+        lines = [
+            "# HELP sis_request_duration_seconds Request latency",
+            "# TYPE sis_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            for endpoint, histogram in sorted(self.histograms.items()):
+                label = _label(endpoint)
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'sis_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+                lines.append(f'sis_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'sis_request_duration_seconds_sum{{endpoint="{label}"}} {histogram[-2]}')
+                lines.append(f'sis_request_duration_seconds_count{{endpoint="{label}"}} {histogram[-1]}')
+            for name, metric, description in COUNTERS:
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} counter")
+                for endpoint, counters in sorted(self.counters.items()):
+                    lines.append(f'{metric}{{endpoint="{_label(endpoint)}"}} {counters[name]}')
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def current():
+    """RequestMetrics of the current request, None outside requests or with metrics disabled."""
+    return g.get("_request_metrics") if has_request_context() else None
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        metrics = current()
+        if metrics is None:
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.render_seconds += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_statement_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["_statement_start"].pop()
+    endpoint = None
+    if has_request_context():
+        endpoint = request.endpoint
+        metrics = g.get("_request_metrics")
+        if metrics is not None:
+            metrics.sql_statements += 1
+            metrics.sql_seconds += duration
+        profile = g.get("_profile")
+        if profile is not None and profile.recording:
+            profile.statements.append((statement, parameters[0] if executemany else parameters, duration))
+    if slow_query_seconds is not None and duration >= slow_query_seconds:
+        slow_queries.warning("%.3fs %s %s%s", duration, endpoint or "-", " ".join(statement.split()),
+                             _logged_parameters(parameters, executemany))
+
+
+def _on_load(target, context):
+    metrics = current()
+    if metrics is not None:
+        metrics.rows += 1
+
+
+def _start_request():
+    g._request_metrics = RequestMetrics()
+
+
+def _finish_request(response):
+    metrics = g.pop("_request_metrics", None)
+    if metrics is not None and request.endpoint != "metrics":
+        if not response.is_streamed:
+            metrics.bytes = response.calculate_content_length() or 0
+        registry.observe(request.endpoint or "none", time.perf_counter() - metrics.start, metrics)
+    return response
+
+
+def query_budget(statements):
+    """Declares the most SQL statements a view may execute, checked by tests/test_query_budget.py."""
+    def decorator(f):
+        f.query_budget = statements
+        return f
+
+    return decorator
+
+
+# <---------------- profiler ---------------->
+
+class Profile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = []  # (statement, parameters, duration)
+        self.recording = True
+        self.profiler = cProfile.Profile()
+
+
+_profile_lock = threading.Lock()
+
+
+def _explain(statement, parameters):
+    # the plan of SELECT statements on SQLite, through the connection of the session so that it sees the same data
+    if db.engine.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    rows = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+    return [row[-1] for row in rows]
+
+
+def _start_profile():
+    if "__profile" not in request.args:
+        return
+    if not current_user.is_authenticated or not current_user.check_admin():
+        abort(403)
+    _profile_lock.acquire()
+    g._profile = profile = Profile()
+    tracemalloc.start()
+    profile.profiler.enable()
+
+
+def _finish_profile(response):
+    profile = g.get("_profile")
+    if profile is None:
+        return response
+    profile.profiler.disable()
+    profile.recording = False
+    duration = time.perf_counter() - profile.start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stream = io.StringIO()
+    pstats.Stats(profile.profiler, stream=stream).sort_stats("cumulative").print_stats(app.config["PROFILE_LIMIT"])
+    statements = [
+        {"statement": statement, "parameters": repr(parameters), "duration": duration,
+         "plan": _explain(statement, parameters)}
+        for statement, parameters, duration in profile.statements
+    ]
+    return jsonify({
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "duration": duration,
+        "memory_peak": peak,
+        "sql_count": len(statements),
+        "sql_seconds": sum(s["duration"] for s in statements),
+        "sql": statements,
+        "profile": stream.getvalue().splitlines(),
+    })
+
+
+def _end_profile(exc):
+    # also after errors, when _finish_profile did not run
+    profile = g.pop("_profile", None)
+    if profile is not None:
+        profile.profiler.disable()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _profile_lock.release()
+
+
+# <---------------- slow query log ---------------->
+
+class _SlowQueryHandler(RotatingFileHandler):
+    # the directory (by default the instance folder) is created together with the file
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def _logged_parameters(parameters, executemany, limit=LOGGED_PARAMETER_LENGTH):
+    # only with SLOW_QUERY_LOG_PARAMETERS, every value cut to limit characters
+    if not app.config["SLOW_QUERY_LOG_PARAMETERS"]:
+        return ""
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    values = parameters.values() if isinstance(parameters, dict) else parameters
+    return " [" + ", ".join(
+        text if len(text) <= limit else text[:limit] + "..." for text in map(repr, values)
+    ) + "]" + (" (first of many)" if executemany else "")
+
+
+slow_queries = logging.getLogger(__name__ + ".slow_queries")
+slow_query_seconds = app.config["SLOW_QUERY_SECONDS"]
+if slow_query_seconds is not None and not slow_queries.handlers:
+    # delay: the file is only created by the first slow query, not by every import of the app
+    handler = _SlowQueryHandler(app.config["SLOW_QUERY_LOG"], maxBytes=10 * 1024 * 1024, backupCount=3,
+                                encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_queries.addHandler(handler)
+    slow_queries.setLevel(logging.WARNING)
+    slow_queries.propagate = False
+
+
+def metrics_view():
+    return app.response_class(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+registry = Registry(app.config["METRICS_BUCKETS"])
+
+for engine in (db.engine, db.read_engine):
+    if engine is not None:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+# the profiler starts after the other before_request functions (which sync the data version) and, as the first
+# registered after_request function, replaces the response last
+app.before_request(_start_profile)
+app.after_request(_finish_profile)
+app.teardown_request(_end_profile)
+
+if app.config["METRICS_ENABLED"]:
+    # first of all before_request functions, so that the latency includes the others
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_finish_request)
+    app.jinja_env.template_class = TimedTemplate
+    event.listen(db.Model, "load", _on_load, propagate=True)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -1,7 +1,7 @@
 from flask_login import UserMixin
 from marshmallow import fields
-from sqlalchemy import UniqueConstraint, CheckConstraint
-from sqlalchemy.orm import backref
+from sqlalchemy import UniqueConstraint, CheckConstraint, func
+from sqlalchemy.orm import backref, configure_mappers
 
 from . import db, login_manager, ma
 
@@ -29,7 +29,7 @@ class Station(db.Model):
     __tablename__ = "station"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), unique=True, nullable=False)
-    state = db.Column(db.String(17), nullable=False)
+    state = db.Column(db.String(17), nullable=False, index=True)
     # for sections
     start_of_s = db.relationship('Section', backref='start_station', lazy='select', foreign_keys='Section.starts_at')
     end_of_s = db.relationship('Section', backref='end_station', lazy='select', foreign_keys='Section.ends_at')
@@ -48,38 +48,103 @@ class Railway(db.Model):
     __tablename__ = "railway"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), unique=True)
-    sections = db.relationship("Section", backref='on_railway', lazy='select')
+    sections = db.relationship("Section", backref='on_railway', lazy='select', foreign_keys="Section.railway_id",
+                               order_by="Section.position")
+
+    # summary of the section chain, kept up to date by append_section/remove_section and the warning routes so that
+    # list pages and the API do not have to walk all sections of every railway
+    start_station_id = db.Column(db.Integer, db.ForeignKey("station.id"))
+    end_station_id = db.Column(db.Integer, db.ForeignKey("station.id"))
+    gauge = db.Column(db.Integer)
+    section_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    total_length = db.Column(db.Numeric(), nullable=False, default=0, server_default="0")
+    total_user_fee = db.Column(db.Numeric(), nullable=False, default=0, server_default="0")
+    warning_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # section <-> warning links
+    # last section of the chain; deferred because snapshots restore railways before sections
+    tail_section_id = db.Column(db.Integer, db.ForeignKey("section.id", name="fk_railway_tail_section_id",
+                                                          use_alter=True, deferrable=True, initially="DEFERRED"))
+
+    start_station = db.relationship("Station", foreign_keys=[start_station_id])
+    end_station = db.relationship("Station", foreign_keys=[end_station_id])
+    # post_update: railway and section refer to each other, the pointer is written after the sections
+    tail_section = db.relationship("Section", foreign_keys=[tail_section_id], post_update=True)
 
     def get_start(self):
-        if len(self.sections) != 0:
-            return Station.query.get(self.sections[0].starts_at).name
+        if self.start_station is not None:
+            return self.start_station.name
         return None
 
     def get_end(self):
-        if len(self.sections) != 0:
-            return Station.query.get(self.sections[-1].ends_at).name
+        if self.end_station is not None:
+            return self.end_station.name
         return None
 
     def get_end_id(self):
-        if len(self.sections) != 0:
-            return self.sections[-1].ends_at
-        return None
+        return self.end_station_id
 
     def get_gauge(self):
-        if len(self.sections) != 0:
-            return self.sections[0].gauge
-        return None
+        return self.gauge
 
     def get_end_section(self):
-        if len(self.sections) != 0:
-            return self.sections[-1]
-        return None
+        return self.tail_section
 
     def has_warning(self):
-        for section in self.sections:
-            if len(section.warnings) > 0:
-                return True
-        return False
+        return self.warning_count > 0
+
+    def append_section(self, section):
+        # section becomes the new end of the chain, positions are 0..section_count-1 so the next one is the count
+        section.on_railway = self
+        section.position = self.section_count
+        self.tail_section = section
+        if self.section_count == 0:
+            self.start_station_id = section.starts_at
+            self.gauge = section.gauge
+        self.end_station_id = section.ends_at
+        self.section_count += 1
+        self.total_length += section.length
+        self.total_user_fee += section.user_fee
+        self.warning_count += len(section.warnings)
+
+    def remove_section(self, section):
+        # only the last section of the chain can be removed, its start is the new end of the railway and the section
+        # before it (one lookup in the (railway_id, position) index) the new tail
+        section.on_railway = None
+        section.position = None
+        self.section_count -= 1
+        self.total_length -= section.length
+        self.total_user_fee -= section.user_fee
+        self.warning_count -= len(section.warnings)
+        if self.section_count == 0:
+            self.start_station_id = None
+            self.end_station_id = None
+            self.gauge = None
+            self.tail_section = None
+        else:
+            self.end_station_id = section.starts_at
+            self.tail_section = Section.query.filter_by(railway_id=self.id, position=self.section_count - 1).one()
+
+    def refresh_summary(self):
+        # full recount, only needed when a section of the railway was edited in place
+        count, length, user_fee = db.session.query(
+            func.count(Section.id),
+            func.coalesce(func.sum(Section.length), 0),
+            func.coalesce(func.sum(Section.user_fee), 0),
+        ).filter(Section.railway_id == self.id).one()
+        self.section_count = count
+        self.total_length = length
+        self.total_user_fee = user_fee
+        self.warning_count = SectionWarning.query.join(Section, Section.id == SectionWarning.section_id) \
+            .filter(Section.railway_id == self.id).count()
+        if count != 0:
+            self.start_station_id = self.sections[0].starts_at
+            self.end_station_id = self.sections[-1].ends_at
+            self.gauge = self.sections[0].gauge
+            self.tail_section = self.sections[-1]
+        else:
+            self.start_station_id = None
+            self.end_station_id = None
+            self.gauge = None
+            self.tail_section = None
 
     # TODO continue adding constraints
 
@@ -94,14 +159,22 @@ class Section(db.Model):
     ends_at = db.Column(db.Integer, db.ForeignKey("station.id"), nullable=False)
     length = db.Column(db.Numeric(), nullable=False)
     user_fee = db.Column(db.Numeric(), nullable=False)
-    max_speed = db.Column(db.Integer, nullable=False)
-    gauge = db.Column(db.Integer, nullable=False)
+    max_speed = db.Column(db.Integer, nullable=False, index=True)
+    gauge = db.Column(db.Integer, nullable=False, index=True)
     railway_id = db.Column(db.Integer, db.ForeignKey("railway.id"))
+    position = db.Column(db.Integer)  # 0-based place in the chain of the railway, None without railway
     warnings = db.relationship("Warning", secondary="section_warning")
 
     __table_args__ = (
         db.UniqueConstraint(starts_at, ends_at, name="uq_starts_at_ends_at"),
         db.CheckConstraint(starts_at != ends_at, name="ck_starts_at_ends_at"),
+        # orders the chain and finds a section by its place; two sections cannot take the same place. Also the index
+        # behind Railway.sections and every other railway_id lookup
+        db.Index("uq_section_railway_id_position", railway_id, position, unique=True),
+        # candidates for section assignment (free sections leaving a station with a gauge), only the free sections
+        # are indexed; ends_at makes it covering for the chain search in chains.free_path
+        db.Index("ix_section_free_starts_at_gauge", starts_at, gauge, ends_at,
+                 sqlite_where=railway_id.is_(None), postgresql_where=railway_id.is_(None)),
     )
 
 
@@ -124,6 +197,17 @@ class SectionWarning(db.Model):
     section = db.relationship("Section", backref=backref("section_warning", cascade="all, delete-orphan"))
     warning = db.relationship("Warning", backref=backref("section_warning", cascade="all, delete-orphan"))
 
+    # the link table is joined from both sides, each index covers the join without reading the table
+    __table_args__ = (
+        db.Index("ix_section_warning_section_id_warning_id", section_id, warning_id),
+        db.Index("ix_section_warning_warning_id_section_id", warning_id, section_id),
+    )
+
+
+# create the backrefs (Section.start_station, Section.on_railway, ...) now, loader options refer to them before the
+# first query would configure the mappers
+configure_mappers()
+
 
 # <------------------- MA Schemas --------------------->
 
@@ -177,6 +261,11 @@ class RailwaySchema(ma.Schema):
             'name',
             'start_station',
             'end_station',
+            'gauge',
+            'section_count',
+            'total_length',
+            'total_user_fee',
+            'warning_count',
             'sections'
         )
 
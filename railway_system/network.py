@@ -0,0 +1,145 @@
+import heapq
+import threading
+from array import array
+
+from . import db
+from .models import Station, Section, SectionWarning
+from .versioning import data_version
+
+METRICS = ("length", "fee", "time")
+
+
+class NetworkIndex:
+    """Read-only adjacency index of the whole rail network.
+
+    Stations are numbered 0..n-1 and the sections leaving station i are the edges offsets[i]:offsets[i + 1] of the
+    flat edge arrays (compressed sparse rows). Sections can be travelled in both directions, so every section is
+    stored once per direction.
+    """
+
+    def __init__(self, stations, sections, warned_section_ids):
+        self.station_ids = array("q", (s.id for s in stations))
+        self.station_names = [s.name for s in stations]
+        self.position = {station_id: i for i, station_id in enumerate(self.station_ids)}
+
+        # count the outgoing edges of every station, then place the edges with a counting sort
+        degree = [0] * (len(self.station_ids) + 1)
+        for s in sections:
+            degree[self.position[s.starts_at] + 1] += 1
+            degree[self.position[s.ends_at] + 1] += 1
+        for i in range(1, len(degree)):
+            degree[i] += degree[i - 1]
+        self.offsets = array("q", degree)
+
+        edge_count = degree[-1]
+        self.sources = array("q", bytes(8 * edge_count))
+        self.targets = array("q", bytes(8 * edge_count))
+        self.section_ids = array("q", bytes(8 * edge_count))
+        self.gauges = array("q", bytes(8 * edge_count))
+        self.warned = array("b", bytes(edge_count))
+        self.weights = {metric: array("d", bytes(8 * edge_count)) for metric in METRICS}
+
+        fill = list(degree[:-1])
+        for s in sections:
+            length = float(s.length)
+            weights = (length, float(s.user_fee), length / s.max_speed if s.max_speed > 0 else float("inf"))
+            for source, target in ((s.starts_at, s.ends_at), (s.ends_at, s.starts_at)):
+                i = self.position[source]
+                e = fill[i]
+                fill[i] += 1
+                self.sources[e] = i
+                self.targets[e] = self.position[target]
+                self.section_ids[e] = s.id
+                self.gauges[e] = s.gauge
+                self.warned[e] = s.id in warned_section_ids
+                for metric, weight in zip(METRICS, weights):
+                    self.weights[metric][e] = weight
+
+    @classmethod
+    def load(cls):
+        # three plain SELECTs, no ORM objects
+        stations = db.session.query(Station.id, Station.name).order_by(Station.id).all()
+        sections = db.session.query(
+            Section.id, Section.starts_at, Section.ends_at, Section.length, Section.user_fee, Section.max_speed,
+            Section.gauge
+        ).all()
+        warned = {section_id for section_id, in db.session.query(SectionWarning.section_id).distinct()}
+        return cls(stations, sections, warned)
+
+    def __contains__(self, station_id):
+        return station_id in self.position
+
+    def route(self, source, target, metric="length", gauge=None, avoid_warnings=False):
+        """Cheapest path between two station ids with Dijkstra, None if the stations are not connected."""
+        weights = self.weights[metric]
+        offsets, targets, gauges, warned = self.offsets, self.targets, self.gauges, self.warned
+        start, goal = self.position[source], self.position[target]
+
+        dist = {start: 0.0}
+        via = {}  # station -> edge it was reached through
+        heap = [(0.0, start)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node == goal:
+                break
+            if d > dist[node]:
+                continue
+            for e in range(offsets[node], offsets[node + 1]):
+                if gauge is not None and gauges[e] != gauge:
+                    continue
+                if avoid_warnings and warned[e]:
+                    continue
+                nd = d + weights[e]
+                t = targets[e]
+                if nd < dist.get(t, float("inf")):
+                    dist[t] = nd
+                    via[t] = e
+                    heapq.heappush(heap, (nd, t))
+        if goal not in dist or dist[goal] == float("inf"):
+            return None
+
+        edges = []
+        node = goal
+        while node != start:
+            e = via[node]
+            edges.append(e)
+            node = self.sources[e]
+        edges.reverse()
+        return self._describe(start, edges, metric, dist[goal])
+
+    def _describe(self, start, edges, metric, cost):
+        stations = [start] + [self.targets[e] for e in edges]
+        return {
+            "from": self.station_ids[start],
+            "to": self.station_ids[stations[-1]],
+            "metric": metric,
+            "cost": cost,
+            "length": sum(self.weights["length"][e] for e in edges),
+            "user_fee": sum(self.weights["fee"][e] for e in edges),
+            "time": sum(self.weights["time"][e] for e in edges),
+            "stations": [{"id": self.station_ids[i], "name": self.station_names[i]} for i in stations],
+            "sections": [self.section_ids[e] for e in edges],
+        }
+
+
+# <---------------------------- index cache ---------------------------->
+
+# the index is rebuilt once one of these tables has a newer data version than the one it was loaded at
+NETWORK_TABLES = ("station", "section", "section_warning")
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def get_network():
+    global _index, _index_version
+    version = data_version.current(NETWORK_TABLES)
+    index = _index
+    if index is not None and _index_version == version:
+        return index
+    index = NetworkIndex.load()
+    with _lock:
+        if data_version.current(NETWORK_TABLES) == version:
+            _index, _index_version = index, version
+    return index
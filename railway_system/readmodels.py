@@ -0,0 +1,155 @@
+from collections import namedtuple
+from math import ceil
+
+from sqlalchemy import select, func, exists
+
+from . import db
+from .models import Station, Section, Railway, Warning, SectionWarning
+
+# Read models of the HTML list pages: plain tuples with exactly the columns a page shows, loaded with one or two
+# joined SELECTs instead of ORM objects whose relationships are walked lazily by the templates.
+#
+# The list functions take the filters of the page and return one Page of rows, only the visible slice is loaded.
+# The filter columns are indexed (see migration 8c1d2e4f6a7b).
+
+RailwayRow = namedtuple("RailwayRow", "id name start end has_warning")
+StationRow = namedtuple("StationRow", "id name state")
+SectionRow = namedtuple("SectionRow", "id start end gauge")
+WarningRow = namedtuple("WarningRow", "id title description sections")  # sections: [(start, end), ...]
+
+station = Station.__table__
+section = Section.__table__
+railway = Railway.__table__
+warning = Warning.__table__
+section_warning = SectionWarning.__table__
+
+
+class Page:
+    """One page of a list, with the attributes of Flask-SQLAlchemy's Pagination that the templates use."""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return max(1, ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    def iter_pages(self, edge=2, around=2):
+        # 1 2 None 7 8 [9] 10 11 None 19 20, None marks a gap
+        last = 0
+        for number in range(1, self.pages + 1):
+            if number <= edge or abs(number - self.page) <= around or number > self.pages - edge:
+                if last + 1 != number:
+                    yield None
+                yield number
+                last = number
+
+
+def _order(sort, columns, key):
+    # "name" ascending, "-name" descending, unknown keys sort by id; the id breaks ties so pages never overlap
+    column = columns.get(sort.lstrip("-")) if sort else None
+    if column is None:
+        return [key]
+    return [column.desc() if sort.startswith("-") else column, key]
+
+
+def _page(make_row, statement, where, order, page, per_page):
+    statement = statement.where(*where)
+    total = db.session.execute(select(func.count()).select_from(statement.subquery())).scalar()
+    page = max(1, min(page, ceil(total / per_page) or 1))
+    statement = statement.order_by(*order).limit(per_page).offset((page - 1) * per_page)
+    items = [make_row(row) for row in db.session.execute(statement)]
+    return Page(items, page, per_page, total)
+
+
+def _yes_no(value, condition):
+    if value == "yes":
+        return [condition]
+    if value == "no":
+        return [~condition]
+    return []
+
+
+def railway_rows(page=1, per_page=50, warning=None, sort=None):
+    start, end = station.alias(), station.alias()
+    statement = select(
+        railway.c.id, railway.c.name, start.c.name, end.c.name, railway.c.warning_count > 0
+    ).select_from(
+        railway.outerjoin(start, start.c.id == railway.c.start_station_id)
+        .outerjoin(end, end.c.id == railway.c.end_station_id)
+    )
+    where = _yes_no(warning, railway.c.warning_count > 0)
+    order = _order(sort, {"name": railway.c.name, "total_length": railway.c.total_length}, railway.c.id)
+    return _page(RailwayRow._make, statement, where, order, page, per_page)
+
+
+def station_rows(page=1, per_page=50, state=None, sort=None):
+    statement = select(station.c.id, station.c.name, station.c.state)
+    where = [station.c.state == state] if state else []
+    order = _order(sort, {"name": station.c.name, "state": station.c.state}, station.c.id)
+    return _page(StationRow._make, statement, where, order, page, per_page)
+
+
+def section_rows(page=1, per_page=50, gauge=None, min_speed=None, max_speed=None, assigned=None, warning=None,
+                 sort=None):
+    start, end = station.alias(), station.alias()
+    statement = select(
+        section.c.id, start.c.name, end.c.name, section.c.gauge
+    ).select_from(
+        section.join(start, start.c.id == section.c.starts_at).join(end, end.c.id == section.c.ends_at)
+    )
+    where = []
+    if gauge:
+        where.append(section.c.gauge == int(gauge))
+    if min_speed is not None:
+        where.append(section.c.max_speed >= min_speed)
+    if max_speed is not None:
+        where.append(section.c.max_speed <= max_speed)
+    where += _yes_no(assigned, section.c.railway_id.isnot(None))
+    where += _yes_no(warning, exists().where(section_warning.c.section_id == section.c.id))
+    order = _order(sort, {"gauge": section.c.gauge, "max_speed": section.c.max_speed, "length": section.c.length},
+                   section.c.id)
+    return _page(SectionRow._make, statement, where, order, page, per_page)
+
+
+def warning_rows(page=1, per_page=50, railway=None, sort=None):
+    statement = select(warning.c.id, warning.c.title, warning.c.description)
+    where = []
+    if railway:
+        where.append(warning.c.id.in_(
+            select(section_warning.c.warning_id)
+            .join(section, section.c.id == section_warning.c.section_id)
+            .where(section.c.railway_id == int(railway))
+        ))
+    order = _order(sort, {"title": warning.c.title}, warning.c.id)
+    result = _page(tuple, statement, where, order, page, per_page)
+
+    # affected sections of the warnings on this page
+    start, end = station.alias(), station.alias()
+    affected = {}
+    for warning_id, start_name, end_name in db.session.execute(select(
+        section_warning.c.warning_id, start.c.name, end.c.name
+    ).select_from(
+        section_warning.join(section, section.c.id == section_warning.c.section_id)
+        .join(start, start.c.id == section.c.starts_at).join(end, end.c.id == section.c.ends_at)
+    ).where(
+        section_warning.c.warning_id.in_([row[0] for row in result.items])
+    ).order_by(section_warning.c.warning_id, section.c.id)):
+        affected.setdefault(warning_id, []).append((start_name, end_name))
+
+    result.items = [
+        WarningRow(warning_id, title, description, affected.get(warning_id, []))
+        for warning_id, title, description in result.items
+    ]
+    return result
@@ -1,19 +1,27 @@
 # shows how API can be used to extract start and end stations of all railways
 import requests
 
-response = requests.get("http://127.0.0.1:5000/get-railways")
+# the API returns railways page by page, next_cursor is the "after" parameter of the next page
+# only the name and the start and end stations are needed -> fields keeps the sections out of the response
+railways = []
+params = {"limit": 100, "fields": "name,start_station.name,end_station.name"}
+while True:
+    response = requests.get("http://127.0.0.1:5000/get-railways", params=params)
+    page = response.json()
+    railways += page["items"]
+    if page["next_cursor"] is None:
+        break
+    params["after"] = page["next_cursor"]
 
-print(response.json())  # = alle railways mit Gesamtinformation
-
-railways = response.json()
+print(railways)  # = alle railways mit Name, Start und Ende
 
 # Für jede Strecke Start- und Endstation ausgeben
 for railway in railways:
     print(f"{railway['name']} hat")
-    if len(railway["sections"]) > 0:
-        start_station = railway["sections"][0]["start_station"]["name"]
-        end_station = railway["sections"][-1]["end_station"]["name"]
+    if railway["start_station"] is not None:  # start and end are part of the railway summary
+        start_station = railway["start_station"]["name"]
+        end_station = railway["end_station"]["name"]
         print(f"-Start: {start_station}")
         print(f"-Ende: {end_station}")
     else:
-        print("-weder Start noch ein Ende")
\ No newline at end of file
+        print("-weder Start noch ein Ende")
@@ -1,13 +1,32 @@
+import io
+
 from flask import render_template, url_for, flash, redirect, request, jsonify, session, abort
+from markupsafe import Markup
 from functools import wraps
 
+from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 
 from . import app, db, bcrypt
 from .forms import RegisterForm, LoginForm, StationForm, SectionForm, RailwayForm, SectionAssignment1, \
-    SectionAssignment2, WarningForm
+    SectionAssignment2, WarningForm, ImportForm, RailwayFilterForm, StationFilterForm, SectionFilterForm, \
+    WarningFilterForm, ChainAssignmentForm
 from .models import User, Railway, Station, stations_schema, station_schema, Section, Warning, railway_schema, \
     section_schema, warning_schema, railways_schema, sections_schema, warnings_schema, SectionWarning
+from .network import get_network, METRICS
+from .api import dump_collection, dump_item, select_fields
+from . import serializers
+from .readmodels import railway_rows, station_rows, section_rows, warning_rows
+from .importer import read_rows, import_network
+from .versioning import conditional
+from .cache import cached_fragment, cached_response, fragments, responses
+from .database import begin_write
+from .chains import assign_chain, ChainError
+from .warning_index import warning_index
+from .warning_links import link_sections, unlink_sections, set_sections, linked_sections, unlink_warnings, \
+    purge_orphan_warnings
+from .instrumentation import query_budget
 from flask_login import login_user, current_user, logout_user, login_required
 
 
@@ -21,17 +40,38 @@ def admin_required(f):
     return decorated_function
 
 
+def with_stations(query):
+    # start and end station of the sections in the same SELECT, for labels like "[id] start - end"
+    return query.options(joinedload(Section.start_station, innerjoin=True),
+                         joinedload(Section.end_station, innerjoin=True))
+
+
+def list_args(form):
+    """page, per_page and the filters of a list page; invalid filter values are ignored."""
+    form.validate()
+    filters = {
+        name: field.data for name, field in form._fields.items()
+        if name != "per_page" and not field.errors and field.data not in (None, "")
+    }
+    per_page = form.per_page.data if form.per_page.data and not form.per_page.errors else app.config["LIST_PAGE_SIZE"]
+    filters["per_page"] = min(per_page, app.config["LIST_MAX_PAGE_SIZE"])
+    filters["page"] = request.args.get("page", 1, type=int)
+    return filters
+
+
 @app.route("/")
 @app.route("/railways")
 @login_required
+@query_budget(3)
 def home():
-    railways = Railway.query.all()
-    return render_template("home.html", railways=railways)
+    form = RailwayFilterForm(request.args)
+    return render_template("home.html", railways=railway_rows(**list_args(form)), form=form)
 
 
 @app.route("/register", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(2)
 def register():
     form = RegisterForm()
     if form.validate_on_submit():
@@ -67,34 +107,42 @@ def logout():
 
 @app.route("/account")
 @login_required
+@query_budget(1)
 def account():
     return render_template("account.html", title="Account")
 
 
 @app.route("/stations")
 @login_required
+@query_budget(3)
 def stations():
-    stations = Station.query.all()
-    return render_template("stations.html", title="Bahnhöfe", stations=stations)
+    form = StationFilterForm(request.args)
+    return render_template("stations.html", title="Bahnhöfe", stations=station_rows(**list_args(form)), form=form)
 
 
 @app.route("/sections")
 @login_required
+@query_budget(3)
 def sections():
-    sections = Section.query.all()
-    return render_template("sections.html", title="Abschnitte", sections=sections)
+    form = SectionFilterForm(request.args)
+    return render_template("sections.html", title="Abschnitte", sections=section_rows(**list_args(form)), form=form)
 
 
 @app.route("/warnings")
 @login_required
+@query_budget(5)
 def warnings():
-    warnings = Warning.query.all()
-    return render_template("warnings.html", title="Abschnitte", warnings=warnings)
+    form = WarningFilterForm(request.args)
+    form.railway.choices = [("", "Alle")] + [
+        (str(railway_id), name) for railway_id, name in db.session.query(Railway.id, Railway.name).order_by(Railway.name)
+    ]
+    return render_template("warnings.html", title="Abschnitte", warnings=warning_rows(**list_args(form)), form=form)
 
 
 @login_required
 @admin_required
 @app.route("/section-assignment", methods=["GET", "POST"])
+@query_budget(2)
 def section_assignment_1():
     form_1 = SectionAssignment1()
     form_1.railway_id.choices = [("0", "---")] + [(s.id, s.name) for s in Railway.query.all()]
@@ -108,6 +156,7 @@ def section_assignment_1():
 @login_required
 @admin_required
 @app.route("/section-assignment/<int:railway_id>", methods=["GET", "POST"])
+@query_budget(10)
 def section_assignment_2(railway_id):
     railway = Railway.query.filter_by(id=railway_id).first()
     railway_name = railway.name
@@ -115,7 +164,7 @@ def section_assignment_2(railway_id):
     if railway.get_end_id() is not None:  # if railway already has sections
         form_2.sections.choices = [
             (s.id, f"[{s.id}] {s.start_station.name} - {s.end_station.name} ({s.gauge} mm)") for s in
-            Section.query.filter_by(
+            with_stations(Section.query).filter_by(
                 railway_id=None,
                 starts_at=railway.get_end_id(),
                 gauge=railway.get_gauge()
@@ -124,22 +173,58 @@ def section_assignment_2(railway_id):
     else:  # if railway does not have any sections yet
         form_2.sections.choices = [
             (s.id, f"[{s.id}] {s.start_station.name} - {s.end_station.name} ({s.gauge} mm)") for s in
-            Section.query.filter_by(railway_id=None).all()
+            with_stations(Section.query).filter_by(railway_id=None).all()
         ]
     if form_2.validate_on_submit():
-        print(form_2.sections.data)
-        section = Section.query.filter_by(id=form_2.sections.data).first()
-        section.railway_id = railway_id
+        # from here on no other request changes the railway; check again what the choices were built from
+        begin_write(db.session)
+        db.session.refresh(railway)
+        section = Section.query.populate_existing().filter_by(id=form_2.sections.data).first()
+        if section is None or section.railway_id is not None or (
+                railway.end_station_id is not None
+                and (section.starts_at != railway.end_station_id or section.gauge != railway.gauge)):
+            db.session.rollback()
+            flash("Strecke oder Abschnitt wurden inzwischen geändert, bitte erneut auswählen.", "warning")
+            return redirect(url_for("section_assignment_2", railway_id=railway_id))
+        railway.append_section(section)
         db.session.commit()
         flash(f"Abschnitt {section.id} wurde zu Strecke {railway_name} zugeordnet!", "success")
         return redirect(url_for("section_assignment_2", railway_id=railway_id))
     return render_template("section_assignment_2.html", title="Abschnitte zu Strecke zuordnen", form=form_2,
-                           railway_name=railway_name)
+                           railway_name=railway_name, railway_id=railway_id)
+
+
+@app.route("/section-assignment/<int:railway_id>/chain", methods=["GET", "POST"])
+@login_required
+@admin_required
+@query_budget(10)
+def chain_assignment(railway_id):
+    railway = Railway.query.get_or_404(railway_id)
+    railway_name = railway.name
+    form = ChainAssignmentForm()
+    form.starts_at.choices = form.ends_at.choices = [(0, "---")] + db.session.query(Station.id, Station.name) \
+        .order_by(Station.name).all()
+    if form.validate_on_submit():
+        begin_write(db.session)
+        db.session.refresh(railway)
+        try:
+            sections = assign_chain(railway, form.section_id_list(), form.starts_at.data or None,
+                                    form.ends_at.data or None)
+        except ChainError as error:
+            db.session.rollback()
+            flash(f"Es wurde nichts zugeordnet: {error}.", "danger")
+        else:
+            db.session.commit()
+            flash(f"{len(sections)} Abschnitte wurden zu Strecke {railway_name} zugeordnet!", "success")
+            return redirect(url_for("chain_assignment", railway_id=railway_id))
+    return render_template("chain_assignment.html", title="Abschnittskette zu Strecke zuordnen", form=form,
+                           railway_name=railway_name, has_sections=railway.end_station_id is not None)
 
 
 @login_required
 @admin_required
 @app.route("/remove-assignment", methods=["GET", "POST"])
+@query_budget(2)
 def remove_assignment_1():
     form_1 = SectionAssignment1()
     form_1.railway_id.choices = [("0", "---")] + [(s.id, s.name) for s in Railway.query.all()]
@@ -153,6 +238,7 @@ def remove_assignment_1():
 @login_required
 @admin_required
 @app.route("/remove-assignment/<int:railway_id>", methods=["GET", "POST"])
+@query_budget(13)
 def remove_assignment_2(railway_id):
     railway = Railway.query.filter_by(id=railway_id).first()
     railway_name = railway.name
@@ -165,9 +251,15 @@ def remove_assignment_2(railway_id):
     else:  # if railway does not have any sections yet
         form_2.sections.choices = []
     if form_2.validate_on_submit():
-        print(railway.sections)
-        removed_section_id = railway.get_end_section().id
-        railway.sections = railway.sections[:-1]
+        begin_write(db.session)
+        db.session.refresh(railway)
+        removed_section = railway.get_end_section()
+        if removed_section is None or removed_section.id != form_2.sections.data:
+            db.session.rollback()
+            flash("Die Strecke wurde inzwischen geändert, bitte erneut auswählen.", "warning")
+            return redirect(url_for("remove_assignment_2", railway_id=railway_id))
+        removed_section_id = removed_section.id
+        railway.remove_section(removed_section)
         db.session.commit()
         flash(f"Abschnitt {removed_section_id} wurde von Strecke {railway_name} gelöst!", "success")
         return redirect(url_for("remove_assignment_2", railway_id=railway_id))
@@ -179,6 +271,7 @@ def remove_assignment_2(railway_id):
 @app.route("/station/new", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(2)
 def new_station():
     form = StationForm()
     if form.validate_on_submit():
@@ -194,6 +287,7 @@ def new_station():
 @app.route("/section/new", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(4)
 def new_section():
     form = SectionForm()
     form.starts_at.choices = [("0", "---")] + [(s.id, s.name) for s in Station.query.all()]
@@ -224,6 +318,7 @@ def new_section():
 @app.route("/railway/new", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(2)
 def new_railway():
     form = RailwayForm()
     if form.validate_on_submit():
@@ -239,19 +334,19 @@ def new_railway():
 @app.route("/warning/new", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(6)
 def new_warning():
     form = WarningForm()
     form.sections.choices = [(s.id, f"[{s.id}] {s.start_station.name} - {s.end_station.name}") for s in
-                             Section.query.all()]
+                             with_stations(Section.query).all()]
     if form.validate_on_submit():
         warning = Warning(
             title=form.title.data,
             description=form.description.data
         )
         db.session.add(warning)
-        for section_id in form.sections.data:
-            section = Section.query.get(section_id)
-            section.warnings.append(warning)  # do I have to query warning again or is warning obj the same as the inserted one?
+        db.session.flush()  # id of the warning for the links
+        link_sections(warning.id, form.sections.data, current=set())
         db.session.commit()
         flash("Warnung wurde erstellt!", "success")
         return redirect(url_for("warnings"))
@@ -259,17 +354,48 @@ def new_warning():
                            form=form, legend="Neue Warnung erstellen")
 
 
+@app.route("/import", methods=["GET", "POST"])
+@login_required
+@admin_required
+@query_budget(7)
+def import_data():
+    form = ImportForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        result = import_network([(form.kind.data, upload.filename, read_rows(stream, upload.filename))])
+        if result.ok:
+            flash(f"Import erfolgreich: {result}", "success")
+            return redirect(url_for("import_data"))
+        flash(f"{len(result.errors)} Fehler, es wurde nichts importiert.", "danger")
+        return render_template("import.html", title="Daten importieren", form=form, legend="Daten importieren",
+                               errors=result.errors)
+    return render_template("import.html", title="Daten importieren", form=form, legend="Daten importieren")
+
+
 # <---------------------------- API GET SPECIFIC ---------------------------->
 
 @app.route("/station/<int:station_id>")
 @login_required
+@query_budget(3)
 def station(station_id):
-    station = Station.query.get_or_404(station_id)
-    return render_template("station.html", title=station.name, station=station)
+    def render():
+        station = Station.query.options(
+            selectinload(Station.start_of_s).joinedload(Section.end_station, innerjoin=True)
+        ).get_or_404(station_id)
+        html = render_template("station_details.html", station=station)
+        rows = {("station", station.id)}
+        for section in station.start_of_s:
+            rows |= {("section", section.id), ("station", section.ends_at)}
+        return (station.name, Markup(html)), len(html), rows
+
+    title, details = cached_fragment(("station", station_id), render)
+    return render_template("station.html", title=title, station_id=station_id, details=details)
 
 
 @app.route("/section/<int:section_id>")
 @login_required
+@query_budget(6)
 def section(section_id):
     section = Section.query.get_or_404(section_id)
     return render_template("section.html", title=f"{section.starts_at} - {section.ends_at}", section=section)
@@ -277,20 +403,47 @@ def section(section_id):
 
 @app.route("/railway/<int:railway_id>")
 @login_required
+@query_budget(4)
 def railway(railway_id):
-    railway = Railway.query.get_or_404(railway_id)
-    return render_template("railway.html", title=f"{railway.get_start()} - {railway.get_end()}", railway=railway)
+    def render():
+        sections = selectinload(Railway.sections)
+        railway = Railway.query.options(
+            joinedload(Railway.start_station),
+            joinedload(Railway.end_station),
+            sections.joinedload(Section.start_station, innerjoin=True),
+            sections.joinedload(Section.end_station, innerjoin=True),
+        ).get_or_404(railway_id)
+        # which warnings affect which section comes from the warning index, only the warnings themselves are loaded
+        warning_ids = warning_index.railway_warning_ids(railway.id)
+        warnings = {w.id: w for w in Warning.query.filter(Warning.id.in_(warning_ids))} if warning_ids else {}
+        section_warnings = {
+            section.id: [warnings[w] for w in warning_index.section_warning_ids(section.id) if w in warnings]
+            for section in railway.sections
+        } if warnings else {}
+        html = render_template("railway_details.html", railway=railway, section_warnings=section_warnings)
+        rows = {("railway", railway.id)} | {("warning", warning_id) for warning_id in warning_ids}
+        for section in railway.sections:
+            rows |= {("section", section.id), ("station", section.starts_at), ("station", section.ends_at)}
+        return (f"{railway.get_start()} - {railway.get_end()}", Markup(html)), len(html), rows
+
+    title, details = cached_fragment(("railway", railway_id), render)
+    return render_template("railway.html", title=title, railway_id=railway_id, details=details)
 
 
 @app.route("/warning/<int:warning_id>")
 @login_required
+@query_budget(3)
 def warning(warning_id):
-    warning = Warning.query.get_or_404(warning_id)
+    warning = Warning.query.options(
+        selectinload(Warning.sections).joinedload(Section.start_station, innerjoin=True),
+        selectinload(Warning.sections).joinedload(Section.end_station, innerjoin=True),
+    ).get_or_404(warning_id)
     return render_template("warning.html", title=warning.title, warning=warning)
 
 
 @app.route("/user/<int:user_id>")
 @login_required
+@query_budget(1)
 def user(user_id):
     user = User.query.get_or_404(user_id)
     return render_template("user.html", title=user.username, user=user)
@@ -301,6 +454,7 @@ def user(user_id):
 @app.route("/user/<int:user_id>/update", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(4)
 def update_user(user_id):
     user = User.query.get_or_404(user_id)
     form = RegisterForm()
@@ -328,6 +482,7 @@ def update_user(user_id):
 @app.route("/station/<int:station_id>/update", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(4)
 def update_station(station_id):
     station = Station.query.get_or_404(station_id)
     form = StationForm()
@@ -355,20 +510,18 @@ def update_station(station_id):
 @app.route("/warning/<int:warning_id>/update", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(13)
 def update_warning(warning_id):
     warning = Warning.query.get_or_404(warning_id)
     form = WarningForm()
     form.sections.choices = [(s.id, f"[{s.id}] {s.start_station.name} - {s.end_station.name}") for s in
-                             Section.query.all()]
+                             with_stations(Section.query).all()]
     # fill in previous data
     if form.validate_on_submit():
+        begin_write(db.session)
         warning.title = form.title.data
         warning.description = form.description.data
-        warning.sections = []
-        # form only contains section ids -> query db to find the section object to append to the warning.sections list
-        for section_id in form.sections.data:
-            section = Section.query.get(section_id)
-            warning.sections.append(section)
+        set_sections(warning.id, form.sections.data)
         db.session.commit()  # no check for integrity error needed, warning does not have unique attributes
         flash("Warnung wurde bearbeitet!", "success")
         return redirect(url_for("warning", warning_id=warning.id))
@@ -385,6 +538,7 @@ def update_warning(warning_id):
 @app.route("/section/<int:section_id>/update", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(11)
 def update_section(section_id):
     section = Section.query.get_or_404(section_id)
     #  uses start and end of section if nothing is chosen (e.g. when locked_stations = True)
@@ -400,6 +554,8 @@ def update_section(section_id):
         section.user_fee = form.user_fee.data
         section.max_speed = form.max_speed.data
         section.gauge = form.gauge.data
+        if section.on_railway is not None:
+            section.on_railway.refresh_summary()
         db.session.commit()  # no integrity check needed, has no unique fields (start=end already handled in form)
         flash("Abschnitt wurde bearbeitet!", "success")
         return redirect(url_for("section", section_id=section.id))
@@ -422,6 +578,7 @@ def update_section(section_id):
 @app.route("/railway/<int:railway_id>/update", methods=["GET", "POST"])
 @login_required
 @admin_required
+@query_budget(4)
 def update_railway(railway_id):
     railway = Railway.query.get_or_404(railway_id)
     form = RailwayForm()
@@ -450,25 +607,34 @@ def update_railway(railway_id):
 @app.route("/station/<int:station_id>/delete", methods=["POST"])
 @login_required
 @admin_required
+@query_budget(6)
 def delete_station(station_id):
     station = Station.query.get_or_404(station_id)
-    try:
-        db.session.delete(station)
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-        flash("Bahnhof kann nicht gelöscht werden, wenn dieser noch in Verwendung ist.", "warning")
-        return redirect(url_for("station", station_id=station.id))
-    flash("Bahnhof wurde gelöscht!", "success")
-    return redirect(url_for("stations"))
+    # checked up front, otherwise the delete first sets the station of every section to NULL before it fails
+    in_use = db.session.query(
+        Section.query.filter(or_(Section.starts_at == station.id, Section.ends_at == station.id)).exists()
+    ).scalar()
+    if not in_use:
+        try:
+            db.session.delete(station)
+            db.session.commit()
+            flash("Bahnhof wurde gelöscht!", "success")
+            return redirect(url_for("stations"))
+        except IntegrityError:
+            db.session.rollback()
+    flash("Bahnhof kann nicht gelöscht werden, wenn dieser noch in Verwendung ist.", "warning")
+    return redirect(url_for("station", station_id=station.id))
 
 
 @app.route("/warning/<int:warning_id>/delete", methods=["POST"])
 @login_required
 @admin_required
 #TODO on delete cascade for sections affecting warnings
+@query_budget(10)
 def delete_warning(warning_id):
     warning = Warning.query.get_or_404(warning_id)
+    begin_write(db.session)
+    unlink_sections(warning.id, linked_sections(warning.id))
     db.session.delete(warning)
     db.session.commit()
     flash("Warnung wurde gelöscht!", "success")
@@ -478,19 +644,19 @@ def delete_warning(warning_id):
 @app.route("/section/<int:section_id>/delete", methods=["POST"])
 @login_required
 @admin_required
+@query_budget(10)
 def delete_section(section_id):
     section = Section.query.get_or_404(section_id)
     #print(section.railway_id)
     if section.railway_id is not None:
         flash("Abschnitt kann nicht gelöscht werden, solange dieser Bestandteil einer Strecke ist.", "warning")
         return redirect(url_for("section", section_id=section.id))
-    warnings = section.warnings
+    # links first, the section has none left when the ORM deletes it; then its warnings that have no other section
+    begin_write(db.session)
+    warning_ids = unlink_warnings(section.id)
     db.session.delete(section)
-    for warning in warnings:
-        print(len(warning.sections))
-        if len(warning.sections) == 0:
-            db.session.delete(warning)
-            db.session.commit()
+    db.session.flush()
+    purge_orphan_warnings(warning_ids)
     db.session.commit()
     flash("Abschnitt wurde gelöscht!", "success")
     return redirect(url_for("sections"))
@@ -499,8 +665,12 @@ def delete_section(section_id):
 @app.route("/railway/<int:railway_id>/delete", methods=["POST"])
 @login_required
 @admin_required
+@query_budget(6)
 def delete_railway(railway_id):
     railway = Railway.query.get_or_404(railway_id)
+    # the sections become free again
+    for section in railway.sections:
+        section.position = None
     db.session.delete(railway)
     db.session.commit()
     flash("Strecke wurde gelöscht!", "success")
@@ -510,6 +680,7 @@ def delete_railway(railway_id):
 @app.route("/user/<int:user_id>/delete", methods=["POST"])
 @login_required
 @admin_required
+@query_budget(3)
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
@@ -520,74 +691,187 @@ def delete_user(user_id):
 
 # <---------------------------- APIs ---------------------------->
 
+# Eager loading plans for the API. Dumping a collection walks every nested relationship, so the whole object graph
+# is loaded up front: many-to-one stations are joined in, collections are fetched with one SELECT ... IN per level.
+# The number of queries per request stays fixed no matter how many rows are dumped.
+def section_graph(path=None):
+    if path is None:
+        return (
+            joinedload(Section.start_station, innerjoin=True),
+            joinedload(Section.end_station, innerjoin=True),
+            selectinload(Section.warnings),
+        )
+    return (
+        path.joinedload(Section.start_station, innerjoin=True),
+        path.joinedload(Section.end_station, innerjoin=True),
+        path.selectinload(Section.warnings),
+    )
+
+
+def railway_graph():
+    return (
+        joinedload(Railway.start_station),
+        joinedload(Railway.end_station),
+    ) + section_graph(selectinload(Railway.sections))
+
+
 # API - get all stations
 @app.route("/get-stations", methods=["GET"])
+@conditional("station")
+@cached_response(Station)
+@query_budget(1)
 def api_stations():
-    all_stations = Station.query.all()
-    result = stations_schema.dump(all_stations)
-    return jsonify(result)
+    query, schema = select_fields(Station, stations_schema)
+    return dump_collection(query, Station, schema)
 
 
 # API - get single station
 @app.route("/get-station/<int:id>", methods=["GET"])
+@conditional("station")
+@cached_response(Station)
+@query_budget(1)
 def api_station(id):
-    station = Station.query.get(id)
-    return station_schema.jsonify(station)
+    query, schema = select_fields(Station, station_schema)
+    return schema.jsonify(query.get(id))
 
 
 # API railways
 @app.route("/get-railways", methods=["GET"])
+@conditional()
+@cached_response(Railway)
+@query_budget(4)
 def api_railways():
-    all_railways = Railway.query.all()
-    result = railways_schema.dump(all_railways)
-    return jsonify(result)
+    query, schema = select_fields(Railway, railways_schema, railway_graph())
+    return dump_collection(query, Railway, schema, fast=serializers.railways)
 
 
 # API railway
 @app.route("/get-railway/<int:id>", methods=["GET"])
+@conditional()
+@cached_response(Railway)
+@query_budget(3)
 def api_railway(id):
-    railway = Railway.query.get(id)
-    return railway_schema.dump(railway)
+    query, schema = select_fields(Railway, railway_schema, railway_graph())
+    return dump_item(query, id, schema, fast=serializers.railways)
 
 
 # API sections
 @app.route("/get-sections", methods=["GET"])
+@conditional("section", "station", "warning", "section_warning")
+@cached_response(Section)
+@query_budget(2)
 def api_sections():
-    all_sections = Section.query.all()
-    result = sections_schema.dump(all_sections)
-    return jsonify(result)
+    query, schema = select_fields(Section, sections_schema, section_graph())
+    return dump_collection(query, Section, schema, fast=serializers.sections)
 
 
 # API section
 @app.route("/get-section/<int:id>", methods=["GET"])
+@conditional("section", "station", "warning", "section_warning")
+@cached_response(Section)
+@query_budget(2)
 def api_section(id):
-    section = Section.query.get(id)
-    return section_schema.dump(section)
+    query, schema = select_fields(Section, section_schema, section_graph())
+    return dump_item(query, id, schema, fast=serializers.sections)
 
 
 # API warnings
 @app.route("/get-warnings", methods=["GET"])
+@conditional("warning")
+@cached_response(Warning)
+@query_budget(1)
 def api_warnings():
-    all_warnings = Warning.query.all()
-    result = warnings_schema.dump(all_warnings)
-    return jsonify(result)
+    # WarningSchema has no nested fields, a single SELECT already covers the whole payload
+    query, schema = select_fields(Warning, warnings_schema)
+    return dump_collection(query, Warning, schema)
 
 
 # API warning
 @app.route("/get-warning/<int:id>", methods=["GET"])
+@conditional("warning")
+@cached_response(Warning)
+@query_budget(1)
 def api_warning(id):
-    warning = Warning.query.get(id)
-    return warning_schema.dump(warning)
+    query, schema = select_fields(Warning, warning_schema)
+    return schema.dump(query.get(id))
+
+
+# API railways with warnings - [{"id": railway_id, "warnings": [warning ids]}], answered from the warning index
+@app.route("/railways-with-warnings", methods=["GET"])
+@conditional("section", "section_warning")
+@query_budget(1)
+def api_railways_with_warnings():
+    return jsonify([
+        {"id": railway_id, "warnings": warning_ids}
+        for railway_id, warning_ids in warning_index.railways_with_warnings()
+    ])
+
+
+# API chain assignment - {"sections": [ids in order]} or {"from": station_id, "to": station_id}, "from" only for
+# railways without sections
+@app.route("/railway/<int:railway_id>/sections", methods=["POST"])
+@login_required
+@admin_required
+@query_budget(9)
+def api_assign_chain(railway_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    section_ids, source, target = data.get("sections"), data.get("from"), data.get("to")
+    if section_ids is not None and not isinstance(section_ids, list):
+        abort(400)
+    if not all(isinstance(value, int) for value in (section_ids or []) + [source, target] if value is not None):
+        abort(400)
+    begin_write(db.session)
+    railway = Railway.query.populate_existing().get_or_404(railway_id)
+    try:
+        sections = assign_chain(railway, section_ids, source, target)
+    except ChainError as error:
+        db.session.rollback()
+        return jsonify({"error": str(error)}), 400
+    result = {"railway": railway.id, "section_count": railway.section_count,
+              "sections": [section.id for section in sections]}
+    db.session.commit()
+    return jsonify(result)
+
+
+# API route - cheapest connection between two stations, answered from the in-memory network index
+@app.route("/route", methods=["GET"])
+@query_budget(3)
+def api_route():
+    source = request.args.get("from", type=int)
+    target = request.args.get("to", type=int)
+    metric = request.args.get("metric", "length")
+    gauge = request.args.get("gauge", type=int)
+    avoid_warnings = request.args.get("avoid_warnings", 0, type=int) == 1
+    if source is None or target is None or metric not in METRICS:
+        abort(400)
+    network = get_network()
+    if source not in network or target not in network:
+        abort(404)
+    result = network.route(source, target, metric=metric, gauge=gauge, avoid_warnings=avoid_warnings)
+    if result is None:
+        abort(404)
+    return jsonify(result)
 
 
 @app.route("/users")
 @login_required
 @admin_required
+@query_budget(2)
 def users():
     users = User.query.all()
     return render_template("users.html", title="Benutzer", users=users)
 
 
+@app.route("/cache-stats")
+@login_required
+@admin_required
+@query_budget(1)
+def cache_stats():
+    return jsonify({"fragments": fragments.stats(), "api": responses.stats()})
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -0,0 +1,144 @@
+from sqlalchemy import select
+
+from . import db
+from .models import Station, Section, Railway, Warning, SectionWarning, StationSchema, WarningSchema, \
+    SectionSchema, RailwaySchema
+
+# Fast path for the hot API endpoints: the payload is built from plain SQL rows instead of ORM objects walked by
+# marshmallow. Output (keys, key order and values) is the same as railways_schema/sections_schema, so jsonify
+# produces identical bytes. Only the full schemas are covered, ?fields= and ?expand= use marshmallow.
+
+CHUNK_SIZE = 500  # ids per IN (...), same batches as selectinload
+
+station = Station.__table__
+section = Section.__table__
+railway = Railway.__table__
+warning = Warning.__table__
+section_warning = SectionWarning.__table__
+
+
+def _layout(schema_cls, columns):
+    # (key, row position) for every field of the schema in output order, position None for nested fields
+    return tuple((name, columns.index(name) if name in columns else None) for name in schema_cls.Meta.fields)
+
+
+STATION_FIELDS = StationSchema.Meta.fields
+WARNING_FIELDS = WarningSchema.Meta.fields
+
+SECTION_COLUMNS = ("id", "length", "user_fee", "max_speed", "gauge", "railway_id", "starts_at", "ends_at")
+SECTION_LAYOUT = _layout(SectionSchema, SECTION_COLUMNS)
+RAILWAY_COLUMNS = ("id", "name", "gauge", "section_count", "total_length", "total_user_fee", "warning_count")
+RAILWAY_LAYOUT = _layout(RailwaySchema, RAILWAY_COLUMNS)
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def _station(row, offset):
+    if row[offset] is None:
+        return None
+    return dict(zip(STATION_FIELDS, row[offset:offset + len(STATION_FIELDS)]))
+
+
+def _station_columns(alias):
+    return [alias.c[name] for name in STATION_FIELDS]
+
+
+def _page(statement, key, after, limit, ids):
+    statement = statement.order_by(key)
+    if ids is not None:
+        statement = statement.where(key.in_(ids))
+    if after is not None:
+        statement = statement.where(key > after)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def _warnings_by_section(section_ids):
+    warnings = {}
+    for chunk in _chunks(section_ids):
+        rows = db.session.execute(
+            select(section_warning.c.section_id, *[warning.c[name] for name in WARNING_FIELDS])
+            .select_from(section.join(section_warning, section.c.id == section_warning.c.section_id)
+                         .join(warning, warning.c.id == section_warning.c.warning_id))
+            .where(section.c.id.in_(chunk))
+        )
+        for row in rows:
+            warnings.setdefault(row[0], []).append(dict(zip(WARNING_FIELDS, row[1:])))
+    return warnings
+
+
+def _section_statement():
+    start, end = station.alias(), station.alias()
+    return select(
+        *[section.c[name] for name in SECTION_COLUMNS], *_station_columns(start), *_station_columns(end)
+    ).select_from(
+        section.join(start, start.c.id == section.c.starts_at).join(end, end.c.id == section.c.ends_at)
+    )
+
+
+def _build_sections(rows):
+    start_offset = len(SECTION_COLUMNS)
+    end_offset = start_offset + len(STATION_FIELDS)
+    warnings = _warnings_by_section([row[0] for row in rows])
+    result = []
+    for row in rows:
+        item = {}
+        for name, position in SECTION_LAYOUT:
+            if position is not None:
+                item[name] = row[position]
+            elif name == "start_station":
+                item[name] = _station(row, start_offset)
+            elif name == "end_station":
+                item[name] = _station(row, end_offset)
+            else:
+                item[name] = warnings.get(row[0], [])
+        result.append(item)
+    return result
+
+
+def sections(after=None, limit=None, ids=None):
+    """Sections ordered by id as sections_schema would dump them."""
+    rows = db.session.execute(_page(_section_statement(), section.c.id, after, limit, ids)).all()
+    return _build_sections(rows)
+
+
+def railways(after=None, limit=None, ids=None):
+    """Railways ordered by id as railways_schema would dump them."""
+    start, end = station.alias(), station.alias()
+    statement = select(
+        *[railway.c[name] for name in RAILWAY_COLUMNS], *_station_columns(start), *_station_columns(end)
+    ).select_from(
+        railway.outerjoin(start, start.c.id == railway.c.start_station_id)
+        .outerjoin(end, end.c.id == railway.c.end_station_id)
+    )
+    rows = db.session.execute(_page(statement, railway.c.id, after, limit, ids)).all()
+
+    # sections of all railways on the page in the order of their chains
+    section_rows = []
+    for chunk in _chunks([row[0] for row in rows]):
+        section_rows.extend(db.session.execute(_section_statement().where(section.c.railway_id.in_(chunk))
+                                               .order_by(section.c.railway_id, section.c.position)))
+    by_railway = {}
+    for item in _build_sections(section_rows):
+        by_railway.setdefault(item["railway_id"], []).append(item)
+
+    start_offset = len(RAILWAY_COLUMNS)
+    end_offset = start_offset + len(STATION_FIELDS)
+    result = []
+    for row in rows:
+        item = {}
+        for name, position in RAILWAY_LAYOUT:
+            if position is not None:
+                item[name] = row[position]
+            elif name == "start_station":
+                item[name] = _station(row, start_offset)
+            elif name == "end_station":
+                item[name] = _station(row, end_offset)
+            else:
+                item[name] = by_railway.get(row[0], [])
+        result.append(item)
+    return result
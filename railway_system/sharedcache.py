@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from . import app, db
+
+log = logging.getLogger(__name__)
+
+# State shared by all worker processes on one host, kept in a small SQLite file next to the database:
+#
+#   changes   one row per commit that changed railway data: the tables and rows (see versioning.py) it changed.
+#             The AUTOINCREMENT counter of this table is the shared generation, every worker replays the changes
+#             after the generation it has seen before it answers a request.
+#   entries   cached values every worker can read, e.g. API responses. A commit deletes the entries that depend on
+#             the rows it changed in the same transaction that creates its generation.
+#
+# The file is only a cache: it can be deleted at any time (with the workers stopped).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS changes (
+    generation INTEGER PRIMARY KEY AUTOINCREMENT,
+    tables TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS entry_rows (
+    key TEXT NOT NULL REFERENCES entries(key) ON DELETE CASCADE,
+    tbl TEXT NOT NULL,
+    row_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_entry_rows_row ON entry_rows (tbl, row_id);
+CREATE INDEX IF NOT EXISTS ix_entry_rows_key ON entry_rows (key);
+"""
+
+KEEP_CHANGES = 10000  # changes kept for workers that fall behind, older ones are pruned
+
+
+def default_path():
+    # "<database>-cache.db" next to a file based SQLite database, None (no sharing) for anything else
+    configured = app.config.get("SHARED_CACHE_PATH")
+    if configured is not None:
+        return configured or None
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    return os.path.splitext(url.database)[0] + "-cache.db"
+
+
+class SharedStore:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        connection = self._connection()
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (os.urandom(4).hex(),))
+        self.epoch = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _connection(self):
+        # one connection per thread and process, sqlite3 connections must not cross either
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(SCHEMA)
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def generation(self):
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    # <---------------- invalidation log ---------------->
+
+    def publish(self, tables, rows):
+        """Records a commit, drops the shared entries depending on its rows and returns its generation."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            generation = connection.execute(
+                "INSERT INTO changes (tables, rows, created) VALUES (?, ?, ?)",
+                (json.dumps(sorted(tables)), json.dumps(sorted(rows, key=str)), time.time()),
+            ).lastrowid
+            for table, row_id in rows:
+                if row_id is None:
+                    connection.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entry_rows WHERE tbl = ?)",
+                                       (table,))
+                else:
+                    connection.execute("DELETE FROM entries WHERE key IN "
+                                       "(SELECT key FROM entry_rows WHERE tbl = ? AND (row_id = ? OR row_id IS NULL))",
+                                       (table, row_id))
+            connection.execute("DELETE FROM changes WHERE generation <= ?", (generation - KEEP_CHANGES,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return generation
+
+    def changes_since(self, generation):
+        """[(generation, tables, rows, created)] after generation, oldest first."""
+        return [
+            (g, json.loads(tables), {tuple(row) for row in json.loads(rows)}, created)
+            for g, tables, rows, created in self._connection().execute(
+                "SELECT generation, tables, rows, created FROM changes WHERE generation > ? ORDER BY generation",
+                (generation,))
+        ]
+
+    # <---------------- shared entries ---------------->
+
+    def get(self, key):
+        """(value, rows) of key or None."""
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] is not None and row[1] < time.time():
+            return None
+        rows = set(connection.execute("SELECT tbl, row_id FROM entry_rows WHERE key = ?", (key,)))
+        return row[0], rows
+
+    def set(self, key, value, rows, generation, ttl=None):
+        """Stores value unless a commit happened after generation."""
+        if self.max_entries <= 0:
+            return
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.generation() == generation:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                connection.execute("INSERT INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                                   (key, value, time.time() + ttl if ttl else None))
+                connection.executemany("INSERT INTO entry_rows (key, tbl, row_id) VALUES (?, ?, ?)",
+                                       [(key, table, row_id) for table, row_id in rows])
+                # oldest entries first out
+                connection.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY rowid "
+                                   "LIMIT max(0, (SELECT count(*) FROM entries) - ?))", (self.max_entries,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def open_store():
+    path = default_path()
+    if path is None:
+        return None
+    try:
+        return SharedStore(path, app.config["SHARED_CACHE_SIZE"])
+    except sqlite3.Error as e:
+        log.warning("shared cache %s not available, workers are not kept in sync: %s", path, e)
+        return None
@@ -0,0 +1,147 @@
+import gzip
+import json
+from decimal import Decimal
+
+from flask_migrate import stamp
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+from . import db
+
+# Snapshot of the whole network as gzip compressed JSON lines:
+#
+#   {"format": "sis-snapshot", "version": 1, "revision": "<alembic revision>"}
+#   {"table": "station", "columns": ["id", "name", "state"]}
+#   {"rows": [[1, 2, ...], ["Wien Hbf", "Linz Hbf", ...], ["Wien", "Oberösterreich", ...]]}   one list per column
+#   ...
+#   {"end": "station", "count": 2}
+#
+# Rows are read and written in batches, neither export nor restore holds more than one batch in memory. Users are
+# not part of a snapshot.
+
+FORMAT = "sis-snapshot"
+VERSION = 1
+BATCH_SIZE = 5000
+EXCLUDED_TABLES = ("user",)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_tables():
+    # parents before children, so that a restore never inserts a row before the row it refers to
+    return [table for table in db.metadata.sorted_tables if table.name not in EXCLUDED_TABLES]
+
+
+def _revision():
+    # None for databases that were created without migrations
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except OperationalError:
+        return None
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} kann nicht gespeichert werden")
+
+
+def _write(stream, record):
+    stream.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=_encode))
+    stream.write("\n")
+
+
+def export_snapshot(path):
+    """Writes all tables to path, returns {table: row count}."""
+    counts = {}
+    connection = db.session.connection()
+    with gzip.open(path, "wt", encoding="utf-8") as stream:
+        _write(stream, {"format": FORMAT, "version": VERSION, "revision": _revision()})
+        for table in snapshot_tables():
+            columns = [column.name for column in table.columns]
+            _write(stream, {"table": table.name, "columns": columns})
+            result = connection.execution_options(stream_results=True).execute(
+                select(table).order_by(*table.primary_key.columns)
+            )
+            count = 0
+            for rows in result.partitions(BATCH_SIZE):
+                _write(stream, {"rows": [list(values) for values in zip(*rows)]})
+                count += len(rows)
+            _write(stream, {"end": table.name, "count": count})
+            counts[table.name] = count
+    db.session.rollback()
+    return counts
+
+
+def _records(stream):
+    for number, line in enumerate(stream, start=1):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise SnapshotError(f"Zeile {number}: ungültiges JSON")
+
+
+def create_schema():
+    # a new database file gets the current schema directly, the migration history cannot build it from scratch
+    if not inspect(db.engine).has_table("station"):
+        db.create_all()
+        stamp()
+
+
+def restore_snapshot(path):
+    """Loads the snapshot in path into the (empty) database in a single transaction, returns {table: row count}."""
+    create_schema()
+    tables = {table.name: table for table in snapshot_tables()}
+    for table in tables.values():
+        if db.session.execute(select(func.count()).select_from(table)).scalar():
+            raise SnapshotError(f"Die Tabelle {table.name} ist nicht leer.")
+
+    counts = {}
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as stream:
+            records = _records(stream)
+            header = next(records, None)
+            if not isinstance(header, dict) or header.get("format") != FORMAT:
+                raise SnapshotError("Die Datei ist kein Snapshot.")
+            if header.get("version") != VERSION:
+                raise SnapshotError(f"Snapshot-Version {header.get('version')} wird nicht unterstützt.")
+            if header.get("revision") != _revision():
+                raise SnapshotError(f"Der Snapshot stammt von Datenbank-Revision {header.get('revision')}, "
+                                    f"die Datenbank ist auf {_revision()}. Bitte zuerst migrieren.")
+
+            table, columns, count = None, None, 0
+            for record in records:
+                if "table" in record:
+                    table = tables.get(record["table"])
+                    if table is None:
+                        raise SnapshotError(f"unbekannte Tabelle {record['table']}")
+                    columns = record["columns"]
+                    unknown = set(columns) - set(table.columns.keys())
+                    if unknown:
+                        raise SnapshotError(f"unbekannte Spalten in {table.name}: {', '.join(sorted(unknown))}")
+                    count = 0
+                elif "rows" in record:
+                    if table is None:
+                        raise SnapshotError("Zeilen ohne Tabelle")
+                    rows = [dict(zip(columns, values)) for values in zip(*record["rows"])]
+                    if rows:
+                        db.session.execute(table.insert(), rows)
+                    count += len(rows)
+                elif "end" in record:
+                    if table is None or record["end"] != table.name or record["count"] != count:
+                        raise SnapshotError(f"Tabelle {record['end']} ist unvollständig")
+                    counts[table.name] = count
+                    table = None
+            if table is not None:
+                raise SnapshotError(f"Tabelle {table.name} ist unvollständig")
+    except (OSError, EOFError) as e:
+        db.session.rollback()
+        raise SnapshotError(f"Die Datei kann nicht gelesen werden ({e}).")
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    return counts
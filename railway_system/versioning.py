@@ -0,0 +1,257 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import ONETOMANY
+
+from . import app, db
+from .api import wants_stream
+from .sharedcache import open_store
+
+log = logging.getLogger(__name__)
+
+TRACKED_TABLES = ("station", "section", "railway", "warning", "section_warning")
+
+
+class DataVersion:
+    """Version counter of the railway data, bumped by every commit that changes one of the tracked tables.
+
+    Every table remembers the global version of its last change, so the version of any group of tables is the
+    highest of its members. With a shared store (see sharedcache.py) the version is the generation shared by all
+    worker processes and every worker replays the changes of the others before it answers a request (sync). Without
+    it the counter lives in process memory and the random epoch keeps ETags of different processes and restarts apart.
+    """
+
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.tables = dict.fromkeys(TRACKED_TABLES, 0)
+        now = datetime.now(timezone.utc)
+        self.modified = dict.fromkeys(TRACKED_TABLES, now)
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.subscribers = []
+        self.shared = None
+
+    def share(self, store):
+        self.shared = store
+        self.epoch = store.epoch
+        self.version = store.generation()
+        self.tables = dict.fromkeys(TRACKED_TABLES, self.version)
+
+    def subscribe(self, callback):
+        """callback(rows) after every change, rows = {(table, id)} of the changed rows, id None for a whole table."""
+        self.subscribers.append(callback)
+
+    def bump(self, tables, rows=()):
+        tables = [t for t in tables if t in self.tables]
+        if not tables:
+            return
+        rows = {row for row in rows if row[0] in self.tables}
+        if self.shared is None:
+            self._apply(self.version + 1, tables, rows, time.time())
+            return
+        try:
+            self.shared.publish(tables, rows)
+        except sqlite3.Error as e:
+            # the other workers only catch up through the cache TTLs
+            log.error("could not publish a change to the shared cache: %s", e)
+            self._apply(self.version, tables, rows, time.time())
+            return
+        self.sync()
+
+    def sync(self):
+        """Applies the changes other processes published since the last call."""
+        if self.shared is None or self.shared.generation() <= self.version:
+            return
+        with self.sync_lock:
+            changes = self.shared.changes_since(self.version)
+            if changes and changes[0][0] != self.version + 1:
+                # this process fell behind further than the kept changes reach
+                generation, _, _, created = changes[-1]
+                changes = [(generation, TRACKED_TABLES, {(t, None) for t in TRACKED_TABLES}, created)]
+            for generation, tables, rows, created in changes:
+                self._apply(generation, tables, rows, created)
+
+    def _apply(self, version, tables, rows, created):
+        modified = datetime.fromtimestamp(created, timezone.utc)
+        with self.lock:
+            self.version = max(self.version, version)
+            for table in tables:
+                if table in self.tables:
+                    self.tables[table] = version
+                    self.modified[table] = modified
+        for callback in self.subscribers:
+            callback(rows)
+
+    def current(self, tables=TRACKED_TABLES):
+        return max(self.tables[t] for t in tables)
+
+    def etag(self, tables=TRACKED_TABLES):
+        return f"{self.epoch}-{self.current(tables)}"
+
+    def last_modified(self, tables=TRACKED_TABLES):
+        """Time of the last change, not rounded (see _http_date for the header)."""
+        return max(self.modified[t] for t in tables)
+
+
+data_version = DataVersion()
+_store = open_store()
+if _store is not None:
+    data_version.share(_store)
+
+
+@app.before_request
+def _sync_version():
+    try:
+        data_version.sync()
+    except sqlite3.Error as e:
+        log.error("could not read the changes of the other workers: %s", e)
+
+
+def _http_date(modified):
+    # Last-Modified only has whole seconds and If-Modified-Since is compared with the exact time of the change: rounded
+    # up, but never later than now (RFC 9110). While the second of the change is not over the header is the current
+    # second, earlier than the change, so a client that sends it back gets a full answer and sees a second change in
+    # the same second as well.
+    return datetime.fromtimestamp(min(math.ceil(modified.timestamp()), int(time.time())), timezone.utc)
+
+
+def conditional(*tables):
+    """Answers with 304 Not Modified, before the view runs, if the client already has the current version.
+
+    The ETag is the version of tables, for NDJSON with a suffix. Responses vary with the Accept header.
+    """
+    tables = tables or TRACKED_TABLES
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = data_version.etag(tables)
+            # the same URL answers with JSON or NDJSON (Accept header), each representation has an ETag of its own
+            if wants_stream():
+                etag += "-ndjson"
+            last_modified = data_version.last_modified(tables)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            response.last_modified = _http_date(last_modified)
+            response.vary.add("Accept")
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+# <---------------------------- change tracking ---------------------------->
+#
+# Every flush records the changed tables and the changed rows as (table, id). A row also marks the rows its foreign
+# keys point to (before and after the change), e.g. a new section marks its stations and its railway. Rows that cannot
+# be named, like the targets of bulk statements, mark the whole table as (table, None), unless the statement names them
+# with the execution option changed_rows={(table, id), ...}.
+
+def _key(state):
+    # new rows only get their identity after the flush, their primary key is already set
+    return state.mapper.local_table.name, state.mapper.primary_key_from_instance(state.obj())[0]
+
+
+def _referenced_rows(state, changed_only):
+    rows = set()
+    mapper = state.mapper
+    for column in mapper.local_table.columns:
+        for foreign_key in column.foreign_keys:
+            history = state.attrs[mapper.get_property_by_column(column).key].history
+            for value in history.added + history.deleted if changed_only else history.sum():
+                if value is not None:
+                    rows.add((foreign_key.column.table.name, value))
+    return rows
+
+
+def _related_rows(state, rel, changed_only):
+    # rows of a loaded relationship, the whole table if it was never loaded
+    if rel.key in state.unloaded:
+        return {(rel.mapper.local_table.name, None)}
+    history = state.attrs[rel.key].history
+    related = history.added + history.deleted if changed_only else history.sum()
+    return {_key(inspect(obj)) for obj in related if obj is not None}
+
+
+def _changed_rows(session):
+    rows = set()
+    dirty, deleted = session.dirty, session.deleted
+    for obj in session.new | dirty | deleted:
+        state = inspect(obj)
+        rows.add(_key(state))
+        rows |= _referenced_rows(state, changed_only=obj in dirty)
+        for rel in state.mapper.relationships:
+            if rel.viewonly or rel.secondary is None and not (obj in deleted and rel.direction is ONETOMANY):
+                continue
+            if obj in deleted:
+                rows |= _related_rows(state, rel, changed_only=False)
+            elif state.attrs[rel.key].history.has_changes():
+                rows |= _related_rows(state, rel, changed_only=True)
+    return rows
+
+
+def _changed_tables(session):
+    tables = set()
+    deleted = session.deleted
+    for obj in session.new | session.dirty | deleted:
+        state = inspect(obj)
+        tables.add(state.mapper.local_table.name)
+        for rel in state.mapper.relationships:
+            if rel.viewonly:
+                continue
+            if obj in deleted:
+                # deleting a row also removes its association rows and detaches its children
+                if rel.secondary is not None:
+                    tables.add(rel.secondary.name)
+                elif rel.direction is ONETOMANY:
+                    tables.add(rel.mapper.local_table.name)
+            elif rel.secondary is not None and state.attrs[rel.key].history.has_changes():
+                tables.add(rel.secondary.name)
+    return tables
+
+
+@event.listens_for(db.session, "after_flush")
+def _note_changes(session, flush_context):
+    session.info.setdefault("changed_tables", set()).update(_changed_tables(session))
+    session.info.setdefault("changed_rows", set()).update(_changed_rows(session))
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _note_bulk_changes(orm_execute_state):
+    # UPDATE/DELETE/INSERT statements executed through the session, e.g. Query.update()
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        rows = orm_execute_state.execution_options.get("changed_rows", {(table.name, None)})
+        orm_execute_state.session.info.setdefault("changed_tables", set()).add(table.name)
+        orm_execute_state.session.info.setdefault("changed_rows", set()).update(rows)
+
+
+@event.listens_for(db.session, "after_commit")
+def _bump_version(session):
+    tables = session.info.pop("changed_tables", None)
+    rows = session.info.pop("changed_rows", ())
+    if tables:
+        data_version.bump(tables, rows)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _forget_changes(session, previous_transaction):
+    session.info.pop("changed_tables", None)
+    session.info.pop("changed_rows", None)
@@ -0,0 +1,129 @@
+import threading
+
+from sqlalchemy import select
+
+from . import db
+from .models import Section, SectionWarning
+from .versioning import data_version
+
+CHUNK_SIZE = 500  # ids per IN (...)
+
+section = Section.__table__
+link = SectionWarning.__table__
+
+
+class WarningIndex:
+    """Which warnings affect which section and railway, kept in memory.
+
+    Loaded with one SELECT on first use and from then on kept up to date from the changed rows of every commit
+    (data_version.subscribe), also those of other worker processes: only the sections named by a change (links added
+    or removed, section assigned to or removed from a railway, section or warning deleted) are read again. A change
+    of a whole table (bulk statements, e.g. the importer) loads everything again.
+
+    Changes are only noted when they arrive, the index reads them at its next use, so that commits never wait for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sections = {}  # section id -> (railway id, frozenset of warning ids), only sections with warnings
+        self.railways = {}  # railway id -> {warning id: number of sections of the railway with that warning}
+        self.loaded = False
+        self.pending_lock = threading.Lock()
+        self.pending = set()  # changed (table, id) not applied yet
+
+    def changed(self, rows):
+        with self.pending_lock:
+            self.pending.update(row for row in rows if row[0] in ("section", "section_warning", "warning", "railway"))
+
+    # <---------------- lookups ---------------->
+
+    def section_warning_ids(self, section_id):
+        self._update()
+        with self.lock:
+            entry = self.sections.get(section_id)
+            return sorted(entry[1]) if entry is not None else []
+
+    def section_warning_count(self, section_id):
+        self._update()
+        with self.lock:
+            entry = self.sections.get(section_id)
+            return len(entry[1]) if entry is not None else 0
+
+    def railway_warning_ids(self, railway_id):
+        self._update()
+        with self.lock:
+            return sorted(self.railways.get(railway_id, ()))
+
+    def railways_with_warnings(self):
+        """[(railway id, [warning ids])] ordered by railway id."""
+        self._update()
+        with self.lock:
+            return [(railway_id, sorted(warnings)) for railway_id, warnings in sorted(self.railways.items())]
+
+    # <---------------- maintenance ---------------->
+
+    def _update(self):
+        if self.loaded and not self.pending:
+            return
+        with self.lock:
+            with self.pending_lock:
+                rows, self.pending = self.pending, set()
+            if not self.loaded or any(row_id is None for _, row_id in rows):
+                self._load()
+                return
+            section_ids = {row_id for table, row_id in rows if table == "section"}
+            warning_ids = {row_id for table, row_id in rows if table == "warning"}
+            railway_ids = {row_id for table, row_id in rows if table == "railway"}
+            # also the indexed sections of changed warnings and railways (deleted ones leave stale entries otherwise)
+            section_ids.update(
+                section_id for section_id, (railway_id, warnings) in self.sections.items()
+                if railway_id in railway_ids or not warning_ids.isdisjoint(warnings)
+            )
+            self._refresh(section_ids)
+
+    def _load(self):
+        self.sections, self.railways = {}, {}
+        self._read(db.session.execute(
+            select(link.c.section_id, section.c.railway_id, link.c.warning_id)
+            .join(section, section.c.id == link.c.section_id)
+        ))
+        self.loaded = True
+
+    def _refresh(self, section_ids):
+        for section_id in section_ids:
+            self._drop(section_id)
+        section_ids = sorted(section_ids)
+        for i in range(0, len(section_ids), CHUNK_SIZE):
+            self._read(db.session.execute(
+                select(link.c.section_id, section.c.railway_id, link.c.warning_id)
+                .join(section, section.c.id == link.c.section_id)
+                .where(link.c.section_id.in_(section_ids[i:i + CHUNK_SIZE]))
+            ))
+
+    def _read(self, rows):
+        found = {}
+        for section_id, railway_id, warning_id in rows:
+            found.setdefault(section_id, (railway_id, set()))[1].add(warning_id)
+        for section_id, (railway_id, warnings) in found.items():
+            self.sections[section_id] = (railway_id, frozenset(warnings))
+            if railway_id is not None:
+                counts = self.railways.setdefault(railway_id, {})
+                for warning_id in warnings:
+                    counts[warning_id] = counts.get(warning_id, 0) + 1
+
+    def _drop(self, section_id):
+        entry = self.sections.pop(section_id, None)
+        if entry is None or entry[0] is None:
+            return
+        railway_id, warnings = entry
+        counts = self.railways[railway_id]
+        for warning_id in warnings:
+            counts[warning_id] -= 1
+            if counts[warning_id] == 0:
+                del counts[warning_id]
+        if not counts:
+            del self.railways[railway_id]
+
+
+warning_index = WarningIndex()
+data_version.subscribe(warning_index.changed)
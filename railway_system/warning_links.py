@@ -0,0 +1,99 @@
+from sqlalchemy import select, insert, delete, update, bindparam, func, exists
+
+from . import db
+from .models import Railway, Section, SectionWarning, Warning
+
+# Links between warnings and sections as set-based statements: one INSERT or DELETE for any number of links (per
+# CHUNK_SIZE sections), the warning counts of the affected railways with one grouped SELECT and one UPDATE, warnings
+# left without sections removed with one DELETE. The statements name the rows they change (changed_rows, see
+# versioning.py) so that only the caches of these rows are invalidated.
+#
+# Bulk statements do not touch loaded objects: callers must not rely on warning.sections, section.warnings or the
+# railway counts of loaded objects before they commit.
+
+CHUNK_SIZE = 500  # ids per IN (...)
+
+link = SectionWarning.__table__
+section = Section.__table__
+railway = Railway.__table__
+warning = Warning.__table__
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def _execute(statement, parameters=None, rows=()):
+    return db.session.execute(statement, parameters, execution_options={"changed_rows": set(rows)})
+
+
+def _shift_counts(section_ids, delta):
+    # every section of section_ids gained (delta=1) or lost (delta=-1) one link -> warning counts of their railways
+    counts = {}
+    for chunk in _chunks(section_ids):
+        for railway_id, count in db.session.execute(
+                select(section.c.railway_id, func.count())
+                .where(section.c.id.in_(chunk), section.c.railway_id.isnot(None)).group_by(section.c.railway_id)):
+            counts[railway_id] = counts.get(railway_id, 0) + count
+    if counts:
+        _execute(update(railway).where(railway.c.id == bindparam("railway"))
+                 .values(warning_count=railway.c.warning_count + bindparam("delta")),
+                 [{"railway": railway_id, "delta": delta * count} for railway_id, count in counts.items()],
+                 rows={("railway", railway_id) for railway_id in counts})
+
+
+def linked_sections(warning_id):
+    """Ids of the sections warning_id is linked with."""
+    return set(db.session.execute(select(link.c.section_id).where(link.c.warning_id == warning_id)).scalars())
+
+
+def link_sections(warning_id, section_ids, current=None):
+    """Links warning_id with those of section_ids it is not linked with yet (current: the ids it is linked with)."""
+    if current is None:
+        current = linked_sections(warning_id)
+    added = set(section_ids) - current
+    if not added:
+        return
+    _execute(insert(link), [{"section_id": section_id, "warning_id": warning_id} for section_id in sorted(added)],
+             rows={("warning", warning_id)} | {("section", section_id) for section_id in added})
+    _shift_counts(added, 1)
+
+
+def unlink_sections(warning_id, section_ids):
+    """Removes the links of warning_id with section_ids."""
+    section_ids = set(section_ids)
+    for chunk in _chunks(section_ids):
+        _execute(delete(link).where(link.c.warning_id == warning_id, link.c.section_id.in_(chunk)),
+                 rows={("warning", warning_id)} | {("section", section_id) for section_id in chunk})
+    _shift_counts(section_ids, -1)
+
+
+def set_sections(warning_id, section_ids):
+    """Links warning_id with exactly section_ids, only the difference to the current links is written."""
+    current = linked_sections(warning_id)
+    unlink_sections(warning_id, current - set(section_ids))
+    link_sections(warning_id, section_ids, current)
+
+
+def unlink_warnings(section_id):
+    """Removes all links of section_id, returns the ids of the warnings it was linked with."""
+    warning_ids = set(db.session.execute(select(link.c.warning_id).where(link.c.section_id == section_id)).scalars())
+    if warning_ids:
+        _execute(delete(link).where(link.c.section_id == section_id),
+                 rows={("section", section_id)} | {("warning", warning_id) for warning_id in warning_ids})
+        _shift_counts({section_id}, -len(warning_ids))
+    return warning_ids
+
+
+def purge_orphan_warnings(warning_ids):
+    """Deletes those of warning_ids that are linked with no section any more, returns their ids."""
+    orphans = set()
+    for chunk in _chunks(warning_ids):
+        orphans.update(db.session.execute(select(warning.c.id).where(
+            warning.c.id.in_(chunk), ~exists().where(link.c.warning_id == warning.c.id)
+        )).scalars())
+    for chunk in _chunks(orphans):
+        _execute(delete(warning).where(warning.c.id.in_(chunk)), rows={("warning", warning_id) for warning_id in chunk})
+    return orphans
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+# the app binds its database on import, the tests get a database file of their own
+directory = tempfile.mkdtemp(prefix="sis-tests-")
+os.environ["SIS_DATABASE_URI"] = "sqlite:///" + os.path.join(directory, "test.db")
+os.environ["SIS_SLOW_QUERY_LOG"] = os.path.join(directory, "slow_queries.log")
+os.environ["SIS_SHARED_CACHE_PATH"] = ""
+
+from railway_system import app, db  # noqa: E402
+from railway_system.cache import fragments, responses  # noqa: E402
+from railway_system.snapshot import create_schema  # noqa: E402
+
+
+def _empty_database():
+    db.session.remove()
+    create_schema()
+    # rows deleted instead of tables dropped: railway and section refer to each other
+    with db.engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def database():
+    """An empty database with the current schema, caches off, inside an app context."""
+    app.config["WTF_CSRF_ENABLED"] = False
+    fragments.max_entries = responses.max_entries = 0
+    with app.app_context():
+        _empty_database()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def build_network(database):
+    """build_network(stations, seed=1): replaces the data with a generated network (benchmarks/network.py)."""
+    from benchmarks import network
+
+    def build(stations, seed=1):
+        _empty_database()
+        result = network.build(network.generate(stations, seed=seed))
+        assert result.ok, str(result)
+        return result
+
+    return build
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(database):
+    """The SQL statements executed during the test, on the writer and on the read-only connections."""
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    engines = [engine for engine in (db.engine, db.read_engine) if engine is not None]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", record)
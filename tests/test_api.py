@@ -0,0 +1,44 @@
+import pytest
+
+from railway_system.models import Station
+
+
+@pytest.fixture
+def stations(database):
+    database.session.add_all(Station(name=f"Bahnhof {i}", state="Tirol") for i in range(5))
+    database.session.commit()
+
+
+def test_pages(stations, client):
+    first = client.get("/get-stations?limit=2").json
+    assert [item["name"] for item in first["items"]] == ["Bahnhof 0", "Bahnhof 1"]
+    second = client.get(f"/get-stations?limit=2&after={first['next_cursor']}").json
+    assert [item["name"] for item in second["items"]] == ["Bahnhof 2", "Bahnhof 3"]
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=abc", "limit=2.5", "after=xyz", "limit=2&after="])
+def test_invalid_page_arguments(stations, client, query):
+    assert client.get(f"/get-stations?{query}").status_code == 400
+
+
+def test_ndjson_has_an_etag_of_its_own(stations, client):
+    json_response = client.get("/get-stations")
+    ndjson_response = client.get("/get-stations", headers={"Accept": "application/x-ndjson"})
+    assert ndjson_response.mimetype == "application/x-ndjson"
+    assert json_response.headers["ETag"] != ndjson_response.headers["ETag"]
+    for response in (json_response, ndjson_response):
+        assert "Accept" in response.headers["Vary"]
+
+    # the ETag of the JSON body does not match the NDJSON representation, and the other way around
+    response = client.get("/get-stations", headers={"Accept": "application/x-ndjson",
+                                                    "If-None-Match": json_response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count("\n") == 5
+    response = client.get("/get-stations", headers={"If-None-Match": ndjson_response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.is_json
+
+    response = client.get("/get-stations", headers={"Accept": "application/x-ndjson",
+                                                    "If-None-Match": ndjson_response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == ndjson_response.headers["ETag"]
@@ -0,0 +1,82 @@
+import sqlite3
+
+from railway_system import importer
+from railway_system.importer import import_network
+from railway_system.models import Railway, Section
+
+STATIONS = [{"name": name, "state": "Tirol"} for name in "ABCD"]
+SECTIONS = [
+    {"start": "A", "end": "B", "length": "10.5", "user_fee": "3", "max_speed": "120", "gauge": "1435"},
+    {"start": "B", "end": "C", "length": "7", "user_fee": "2", "max_speed": "100", "gauge": "1435"},
+    {"start": "C", "end": "D", "length": "4", "user_fee": "1", "max_speed": "80", "gauge": "1435"},
+]
+
+
+def sources(**rows):
+    return [(kind, f"{kind}.jsonl", list(enumerate(records, start=1))) for kind, records in rows.items()]
+
+
+def messages(result):
+    return [(source, line, message) for source, line, message in result.errors]
+
+
+def test_import_network(database):
+    result = import_network(sources(stations=STATIONS, sections=SECTIONS,
+                                    railways=[{"name": "R", "stations": "A;B;C"}]))
+    assert result.ok, str(result)
+    railway = Railway.query.filter_by(name="R").one()
+    assert railway.section_count == 2
+    assert railway.get_end_section().ends_at == railway.end_station_id
+
+
+def test_railway_twice_in_one_import(database):
+    result = import_network(sources(stations=STATIONS, sections=SECTIONS,
+                                    railways=[{"name": "R", "stations": "A;B"}, {"name": "R", "stations": "B;C"}]))
+    assert messages(result) == [("railways.jsonl", 2, "Strecke 'R' mehrfach angegeben")]
+    assert Railway.query.count() == 0
+
+
+def test_section_of_a_railway_is_not_changed(database):
+    assert import_network(sources(stations=STATIONS, sections=SECTIONS,
+                                  railways=[{"name": "R", "stations": "A;B"}])).ok
+    changed = [dict(SECTIONS[0], max_speed="160"), dict(SECTIONS[1], max_speed="160")]
+    result = import_network(sources(sections=changed))
+    assert messages(result) == [
+        ("sections.jsonl", 1, "Abschnitt A - B gehört bereits zu einer Strecke und kann nicht geändert werden")
+    ]
+    assert {section.max_speed for section in Section.query} == {120, 100, 80}
+    # unchanged rows of assigned sections, and changes of free ones, are fine
+    result = import_network(sources(sections=[SECTIONS[0], dict(SECTIONS[1], max_speed="160")]))
+    assert result.ok, str(result)
+    assert sorted(section.max_speed for section in Section.query) == [80, 120, 160]
+
+
+def test_whole_numbers_only(database):
+    rows = [dict(SECTIONS[0], max_speed="120.5"), dict(SECTIONS[1], gauge="1435.0"), dict(SECTIONS[2], length="NaN")]
+    result = import_network(sources(stations=STATIONS, sections=rows))
+    assert messages(result) == [
+        ("sections.jsonl", 1, "ungültige Maximalgeschwindigkeit"),
+        ("sections.jsonl", 3, "ungültige Länge oder Nutzungsentgelt"),
+    ]
+
+
+def test_validation_holds_the_write_lock(database, monkeypatch):
+    # while the sections are checked, before anything is written, no other connection can start a write
+    locked = []
+    number = importer._number
+
+    def _number(row, key, kind):
+        other = sqlite3.connect(database.engine.url.database, timeout=0)
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            locked.append(False)
+        except sqlite3.OperationalError:
+            locked.append(True)
+        finally:
+            other.close()
+        return number(row, key, kind)
+
+    monkeypatch.setattr(importer, "_number", _number)
+    result = import_network(sources(stations=STATIONS, sections=SECTIONS, railways=[{"name": "R", "stations": "A;B"}]))
+    assert result.ok, str(result)
+    assert locked and all(locked)
@@ -0,0 +1,45 @@
+import pytest
+
+from railway_system import app, instrumentation
+from railway_system.models import User
+
+HASH = "$2b$12$" + "x" * 53
+
+
+@pytest.fixture
+def slow_query_log(database, monkeypatch):
+    """Logs every statement as slow, returns a function reading the log."""
+    monkeypatch.setattr(instrumentation, "slow_query_seconds", 0)
+    # the alembic logging config of create_schema (stamp) disables existing loggers
+    monkeypatch.setattr(instrumentation.slow_queries, "disabled", False)
+    handler = instrumentation.slow_queries.handlers[0]
+    handler.flush()
+    start = handler.stream.tell() if handler.stream else 0
+
+    def read():
+        handler.flush()
+        with open(handler.baseFilename, encoding="utf-8") as stream:
+            stream.seek(start)
+            return stream.read()
+
+    return read
+
+
+def add_user(database):
+    database.session.add(User(username="geheim", password=HASH, is_admin=False))
+    database.session.commit()
+
+
+def test_parameters_are_not_logged(slow_query_log, database):
+    add_user(database)
+    log = slow_query_log()
+    assert "INSERT INTO user" in log
+    assert HASH not in log and "geheim" not in log
+
+
+def test_parameters_are_truncated(slow_query_log, database, monkeypatch):
+    monkeypatch.setitem(app.config, "SLOW_QUERY_LOG_PARAMETERS", True)
+    add_user(database)
+    log = slow_query_log()
+    assert "'geheim'" in log
+    assert HASH[:20] in log and HASH not in log
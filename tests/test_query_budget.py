@@ -0,0 +1,224 @@
+"""Every view stays within its SQL statement budget (@query_budget(n) next to the view function), on a small and on a
+large generated network, with the same number of statements on both.
+
+Pages are requested with GET. Views that take POST requests are measured once more with a valid form (WRITES), as a
+real write: a POST that shows the form again or redirects with a warning fails as well. The sizes are set with
+SIS_QUERY_BUDGET_SIZES (stations, "2000 10000" by default, both big enough to fill every page);
+python -m benchmarks.query_budget runs this test with other sizes and prints the table.
+"""
+import io
+import os
+
+from flask import url_for
+
+from railway_system import app, bcrypt, db
+from railway_system.models import Station, Railway, Section, SectionWarning, Warning, User
+
+SIZES = [int(size) for size in os.environ.get("SIS_QUERY_BUDGET_SIZES", "2000 10000").split()]
+SEED = int(os.environ.get("SIS_QUERY_BUDGET_SEED", 1))
+VERBOSE = os.environ.get("SIS_QUERY_BUDGET_VERBOSE") == "1"  # also print the routes within their budget
+
+# endpoints that are not measured: static files, the login itself and what is only there for operators
+SKIPPED = {"static", "login", "logout", "metrics"}
+# URL parameter -> table of the row it names, <id> of the API endpoints names the row of the endpoint
+PARAMETERS = {"railway_id": "railway", "station_id": "station", "section_id": "section", "warning_id": "warning",
+              "user_id": "user"}
+# query strings of endpoints that need one
+QUERY_STRINGS = {"api_route": lambda ids: {"from": ids["route"][0], "to": ids["route"][1]}}
+PASSWORD = "budget-password"
+
+
+def _free_chain(railway_id, count):
+    """Ids of up to count free sections continuing the end of railway_id."""
+    railway = Railway.query.get(railway_id)
+    chain, end = [], railway.end_station_id
+    while len(chain) < count:
+        section_id, end = Section.query.with_entities(Section.id, Section.ends_at).filter(
+            Section.railway_id.is_(None), Section.starts_at == end, Section.gauge == railway.gauge,
+            Section.id.notin_(chain)
+        ).order_by(Section.id).first() or (None, None)
+        if section_id is None:
+            break
+        chain.append(section_id)
+    return chain
+
+
+def _tail(railway_id):
+    return Railway.query.get(railway_id).tail_section_id
+
+
+def _station(name):
+    return Station.query.filter_by(name=name).one().id
+
+
+# The write requests, in this order after all pages: (endpoint, URL values, request arguments, outcome of a successful
+# write). Values and arguments are functions of the ids (see _ids), called right before the request, earlier writes
+# change the rows. Every form is valid; the outcome (status and category of the flashed message) tells a write from a
+# form shown again or an early redirect with a warning.
+WRITTEN = "302 success"  # redirect with a success message
+WRITES = [
+    ("register", {}, lambda ids: {"data": {
+        "username": "budget-new", "password": PASSWORD, "confirm_password": PASSWORD}}, WRITTEN),
+    ("update_user", lambda ids: {"user_id": ids["throwaway_user"]}, lambda ids: {"data": {
+        "username": "budget-old", "password": PASSWORD, "confirm_password": PASSWORD}}, WRITTEN),
+    ("new_station", {}, lambda ids: {"data": {"name": "Budget Bahnhof", "state": "Tirol"}}, WRITTEN),
+    ("update_station", lambda ids: {"station_id": ids["station"]},
+     lambda ids: {"data": {"name": "Budget Bahnhof Mitte", "state": "Wien"}}, WRITTEN),
+    ("new_section", {}, lambda ids: {"data": {
+        "starts_at": ids["station"], "ends_at": _station("Budget Bahnhof"), "length": "12.5", "user_fee": "4",
+        "max_speed": "120", "gauge": "1435"}}, WRITTEN),
+    # a section of the longest railway, its summary is computed again
+    ("update_section", lambda ids: {"section_id": ids["section"]}, lambda ids: {"data": {
+        "starts_at": ids["section_stations"][0], "ends_at": ids["section_stations"][1], "length": "9.5",
+        "user_fee": "3", "max_speed": "80", "gauge": str(ids["section_gauge"])}}, WRITTEN),
+    ("new_railway", {}, lambda ids: {"data": {"name": "Budget Strecke"}}, WRITTEN),
+    ("update_railway", lambda ids: {"railway_id": ids["railway"]},
+     lambda ids: {"data": {"name": "Budget Lang"}}, WRITTEN),
+    ("new_warning", {}, lambda ids: {"data": {
+        "title": "Budget", "description": "Neue Warnung", "sections": [ids["section"], ids["free_section"]]}},
+     WRITTEN),
+    ("update_warning", lambda ids: {"warning_id": ids["warning"]}, lambda ids: {"data": {
+        "title": "Budget", "description": "Geänderte Warnung", "sections": [ids["section"], ids["free_section"]]}},
+     WRITTEN),
+    # the first steps only redirect to the second
+    ("section_assignment_1", {}, lambda ids: {"data": {"railway_id": ids["assign_railway"]}}, "302"),
+    ("remove_assignment_1", {}, lambda ids: {"data": {"railway_id": ids["assign_railway"]}}, "302"),
+    # removes the last section of the railway, which is then free to be assigned again
+    ("remove_assignment_2", lambda ids: {"railway_id": ids["assign_railway"]},
+     lambda ids: {"data": {"sections": ids.setdefault("removed", _tail(ids["assign_railway"]))}}, WRITTEN),
+    ("section_assignment_2", lambda ids: {"railway_id": ids["assign_railway"]},
+     lambda ids: {"data": {"sections": ids["removed"]}}, WRITTEN),
+    ("chain_assignment", lambda ids: {"railway_id": ids["assign_railway"]}, lambda ids: {"data": {
+        "section_ids": ", ".join(map(str, _free_chain(ids["assign_railway"], 3))), "starts_at": 0, "ends_at": 0}},
+     WRITTEN),
+    ("api_assign_chain", lambda ids: {"railway_id": ids["chain_railway"]},
+     lambda ids: {"json": {"sections": _free_chain(ids["chain_railway"], 3)}}, "200"),
+    ("import_data", {}, lambda ids: {"data": {
+        "kind": "stations", "file": (io.BytesIO("name,state\nBudget Import,Tirol\n".encode()), "stations.csv")}},
+     WRITTEN),
+    ("delete_station", lambda ids: {"station_id": _station("Budget Import")}, lambda ids: {}, WRITTEN),
+    # a free section with warnings: its links are removed and warnings without other sections deleted
+    ("delete_section", lambda ids: {"section_id": ids["free_section"]}, lambda ids: {}, WRITTEN),
+    ("delete_warning", lambda ids: {"warning_id": ids["warning"]}, lambda ids: {}, WRITTEN),
+    ("delete_railway", lambda ids: {"railway_id": ids["railway"]}, lambda ids: {}, WRITTEN),
+    ("delete_user", lambda ids: {"user_id": ids["throwaway_user"]}, lambda ids: {}, WRITTEN),
+]
+
+
+def _ids():
+    """One representative row per table: the longest railway and rows in the middle of the others."""
+    def middle(query):
+        return query.offset(query.count() // 2).limit(1).scalar()
+
+    longest = db.session.query(Railway.id, Railway.start_station_id, Railway.end_station_id) \
+        .order_by(Railway.section_count.desc(), Railway.id).first()
+    section = middle(db.session.query(Section.id).filter(Section.railway_id.isnot(None)).order_by(Section.id))
+    section_row = Section.query.get(section)
+    free = Section.__table__.alias()
+    # railways whose end has free sections, one for the single and one for the chain assignments
+    assign_railway, chain_railway = db.session.query(Railway.id).filter(Railway.id != longest[0]).join(
+        free, (free.c.starts_at == Railway.end_station_id) & (free.c.gauge == Railway.gauge)
+        & free.c.railway_id.is_(None)
+    ).group_by(Railway.id).order_by(Railway.id).limit(2).all()
+    return {
+        "railway": longest[0],
+        "route": longest[1:],
+        "station": middle(db.session.query(Station.id).order_by(Station.id)),
+        "section": section,
+        "section_stations": (section_row.starts_at, section_row.ends_at),
+        "section_gauge": section_row.gauge,
+        "free_section": middle(db.session.query(Section.id).filter(Section.railway_id.is_(None)).join(
+            SectionWarning, SectionWarning.section_id == Section.id).group_by(Section.id).order_by(Section.id)),
+        "warning": middle(db.session.query(Warning.id).order_by(Warning.id)),
+        "user": db.session.query(User.id).filter(User.username == "query-budget").scalar(),
+        "throwaway_user": db.session.query(User.id).filter(User.username == "query-budget-delete").scalar(),
+        "assign_railway": assign_railway[0],
+        "chain_railway": chain_railway[0],
+    }
+
+
+def _add_users():
+    password = bcrypt.generate_password_hash("x").decode("utf-8")
+    # the second user is deleted by delete_user, the first one stays logged in
+    db.session.add(User(username="query-budget", password=password, is_admin=True))
+    db.session.add(User(username="query-budget-delete", password=password, is_admin=True))
+    db.session.commit()
+
+
+def measure(client, statements):
+    """{"endpoint method": [endpoint, method, url, status, statements, budget, outcome, expected outcome]}."""
+    _add_users()
+    ids = _ids()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(ids["user"])
+        session["_fresh"] = True
+
+    def request(endpoint, method, values, arguments=None, expected=None):
+        with app.test_request_context():
+            url = url_for(endpoint, **values)
+        statements.clear()
+        response = client.open(url, method=method, **(arguments or {}))
+        count = len(statements)
+        with client.session_transaction() as session:
+            flashed = session.pop("_flashes", [])
+        outcome = " ".join([str(response.status_code)] + [category for category, _ in flashed[-1:]])
+        budget = getattr(app.view_functions[endpoint], "query_budget", None)
+        results[f"{endpoint} {method}"] = [endpoint, method, url, response.status_code, count, budget, outcome,
+                                           expected]
+
+    results = {}
+    # pages first, they show the rows the writes change
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.endpoint):
+        if rule.endpoint in SKIPPED or "GET" not in rule.methods:
+            continue
+        values = {
+            argument: ids[PARAMETERS.get(argument) or rule.endpoint.replace("api_", "")]
+            for argument in rule.arguments
+        }
+        values.update(QUERY_STRINGS.get(rule.endpoint, lambda ids: {})(ids))
+        request(rule.endpoint, "GET", values)
+    for endpoint, values, arguments, expected in WRITES:
+        values = values(ids) if callable(values) else values
+        request(endpoint, "POST", values, arguments(ids), expected)
+    # views that take POST requests but have no write in WRITES
+    for rule in app.url_map.iter_rules():
+        if "POST" in rule.methods and rule.endpoint not in SKIPPED and f"{rule.endpoint} POST" not in results:
+            results[f"{rule.endpoint} POST"] = [rule.endpoint, "POST", rule.rule, None, 0, None, None, None]
+    return results
+
+
+def problems(small, large):
+    """{"endpoint method": [problem, ...]} of the requests that fail, printed as a table."""
+    failed = {}
+    print(f"\n{'endpoint':<28}{'method':<8}{'status':>7}{SIZES[0]:>8}{SIZES[1]:>8}{'budget':>8}")
+    for key in sorted(large):
+        endpoint, method, url, status, count, budget, outcome, expected = large[key]
+        small_count, small_outcome = small[key][4], small[key][6]
+        found = []
+        if status is None:
+            found.append("no write in WRITES")
+        elif count > small_count:
+            found.append("grows with the data")
+        if budget is not None and max(count, small_count) > budget:
+            found.append("over budget")
+        if budget is None:
+            found.append("no budget")
+        if status is not None and status >= 500:
+            found.append("error")
+        elif expected is not None and (outcome != expected or small_outcome != expected):
+            found.append(f"nothing written ({small_outcome} / {outcome}, expected {expected})")
+        if found:
+            failed[key] = found
+        if found or VERBOSE:
+            print(f"{endpoint:<28}{method:<8}{status or '-':>7}{small_count:>8}{count:>8}{budget or '-':>8}  "
+                  + ", ".join(found))
+    print(f"{len(large)} requests, {len(failed)} failed")
+    return failed
+
+
+def test_query_budgets(build_network, client, statements):
+    results = []
+    for stations in SIZES:
+        build_network(stations, seed=SEED)
+        results.append(measure(client, statements))
+    assert problems(*results) == {}
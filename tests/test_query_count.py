@@ -0,0 +1,35 @@
+"""The collection APIs load the object graph with a fixed number of SQL statements, however many rows they dump."""
+import pytest
+
+from railway_system import app
+
+SIZES = (300, 1200)  # stations of the small and the large network
+# rows per page: the small network does not fill it, the large one does. Collections are loaded with IN (...) lists of
+# up to 500 ids (SQLAlchemy), a page of more rows takes more statements however big the network is.
+LIMIT = 400
+URLS = [
+    f"/get-railways?limit={LIMIT}",
+    f"/get-sections?limit={LIMIT}",
+    f"/get-sections?limit={LIMIT}&expand=start_station,end_station",
+]
+
+
+@pytest.fixture(params=["fast", "marshmallow"])
+def serializer(request, monkeypatch):
+    if request.param == "marshmallow":
+        monkeypatch.setitem(app.config, "API_FAST_SERIALIZER", set())
+    return request.param
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_statements_stay_flat(build_network, client, statements, serializer, url):
+    counts, sizes = [], []
+    for stations in SIZES:
+        build_network(stations)
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200
+        counts.append(len(statements))
+        sizes.append(len(response.json["items"] if isinstance(response.json, dict) else response.json))
+    assert sizes[0] < sizes[1]
+    assert counts[0] == counts[1]